@@ -10,4 +10,4 @@ db = SQLAlchemy(app)
 jwt = JWTManager(app)
 migrate = Migrate(app, db)
 
-from app import routes, models
+from app import routes, models, commands, query_stats, sqlite_pragmas, metrics
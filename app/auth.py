@@ -0,0 +1,67 @@
+from flask import g
+from flask_jwt_extended import create_access_token, get_jwt_identity, get_jwt_claims
+from sqlalchemy import and_, exists
+from app import db, db_manager, models
+
+# The user making the request as described by the claims of its access token.
+# Routes that only need the id or username of the caller can use it without
+# loading the User row, which is loaded on first use of user.
+class CurrentUser(object):
+
+    def __init__(self, email, user_id, username, user=None):
+        self.email = email
+        self.id = user_id
+        self.username = username
+        self._user = user
+        self._followed_ids = None
+
+    def __repr__(self):
+        return '<CurrentUser {}>'.format(self.username)
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = db_manager.get_user_by_id(self.id)
+        return self._user
+
+    # Same as User.followed_ids, loads the followed user ids once per request
+    def followed_ids(self):
+        if self._followed_ids is None:
+            self._followed_ids = set(followed_id for (followed_id,) in db.session.query(
+                models.followers.c.followed_id).filter(models.followers.c.follower_id == self.id))
+        return self._followed_ids
+
+    def is_following(self, user):
+        if self._followed_ids is not None:
+            return user.id in self._followed_ids
+        return db.session.query(exists().where(and_(
+            models.followers.c.follower_id == self.id, models.followers.c.followed_id == user.id))).scalar()
+
+    def to_dict(self):
+        return {
+                "user_id": self.id,
+                "username": self.username,
+                "email": self.email
+            }
+
+# Returns the CurrentUser of the request. Tokens issued before the user id
+# and username were added to the claims fall back to looking the user up by
+# the email in the token identity.
+def get_current_user():
+    if 'current_user' not in g:
+        email = get_jwt_identity()
+        claims = get_jwt_claims()
+        if 'user_id' in claims:
+            g.current_user = CurrentUser(email, claims['user_id'], claims['username'])
+        else:
+            user = db_manager.get_user_by_email(email)
+            g.current_user = CurrentUser(email, user.id, user.username, user)
+    return g.current_user
+
+# Creates an access token for user (a User or CurrentUser) carrying the user
+# id and username as claims.
+def create_user_access_token(user):
+    return create_access_token(identity=user.email, user_claims={
+                "user_id": user.id,
+                "username": user.username
+            })
@@ -0,0 +1,42 @@
+import click
+from app import app, db_manager, replica
+
+# - - - Maintenance commands, run with 'flask <command>' - - -
+
+# Regenerates the home timelines from the followers and question tables, used
+# for recovery and before enabling FEED_TIMELINE_ENABLED on existing data.
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    entries = db_manager.rebuild_timelines()
+    click.echo("Rebuilt timelines with {} entries".format(entries))
+
+
+# Recomputes the stored like and answer counts of the questions to repair any
+# drift from the question_likes and answer tables.
+@app.cli.command('reconcile-counters')
+def reconcile_counters():
+    repaired = db_manager.reconcile_question_counters()
+    click.echo("Repaired the counters of {} questions".format(repaired))
+
+
+# Moves the trending epoch to now and scales the hot scores down, run about
+# once an hour. --rebuild recomputes the scores from the stored counts, after
+# the migration that added them or to repair them.
+@app.cli.command('rescore-trending')
+@click.option('--rebuild', is_flag=True, help="Recompute the scores from the like and answer counts")
+def rescore_trending(rebuild):
+    updated = db_manager.rescore_trending(rebuild)
+    click.echo("Rescored {} questions".format(updated))
+
+
+# Copies the primary database into the read replica when both are SQLite
+# files, for trying the replica routing locally.
+@app.cli.command('sync-replica')
+def sync_replica():
+    if not replica.is_configured():
+        raise click.ClickException("No replica configured, set DATABASE_REPLICA_URL")
+    try:
+        replica.sync_sqlite_replica()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo("Copied the primary database to the replica")
@@ -0,0 +1,39 @@
+import sys
+
+# Support for running the application in gevent workers, where each request
+# is a greenlet and blocking I/O switches to other greenlets. Gunicorn
+# monkey patches the standard library before the application is loaded, this
+# module handles what the patching does not cover.
+
+# Whether the process runs with gevent monkey patching, i.e. in a gevent worker
+def is_gevent_patched():
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('socket')
+
+# Waits for psycopg2 with the gevent hub instead of blocking the worker, so
+# other greenlets run during database round trips. The same wait callback as
+# the one of psycogreen. Does nothing if psycopg2 is not installed.
+def patch_psycopg():
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    from gevent.socket import wait_read, wait_write
+
+    def gevent_wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError('Bad result from poll: {!r}'.format(state))
+
+    extensions.set_wait_callback(gevent_wait_callback)
+    return True
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from app import app, db, models
+from app.json_provider import jsonify
+
+# Read only copy of a row of the course table, safe to share between requests
+# and threads since it is not bound to a session.
+class CachedCourse(namedtuple('CachedCourse', ['id', 'course_code', 'course_name'])):
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+                "course_id": self.id,
+                "course_code": self.course_code,
+                "course_name": self.course_name
+            }
+
+# The catalog as loaded at one version of the course table. A snapshot is
+# never modified, a reload replaces it as a whole.
+CatalogSnapshot = namedtuple('CatalogSnapshot', ['version', 'courses', 'by_code', 'body'])
+
+# Process local cache of the course table, so listing the courses and looking
+# up the course of a new question does not query the course table.
+#
+# Every change to the course table bumps the 'courses' version stamp in the
+# same transaction. The cached catalog is reloaded when the stamp no longer
+# matches, which is checked at most every COURSE_CACHE_REFRESH_SECONDS and is
+# how courses changed by other worker processes are picked up. Changes made
+# by this process invalidate the cache directly.
+class CourseCatalog(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = None
+
+    def get(self):
+        snapshot = self._snapshot
+        checked_at = self._checked_at
+        if snapshot is None:
+            return self.load()
+        if time.monotonic() - checked_at >= app.config['COURSE_CACHE_REFRESH_SECONDS']:
+            version = self._current_version()
+            if version != snapshot.version:
+                return self.load()
+            self._checked_at = time.monotonic()
+        return snapshot
+
+    # Reads the course table and the version it was read at into a new
+    # snapshot, including the pre-serialized /courses response body.
+    def load(self):
+        with self._lock:
+            version = self._current_version()
+            courses = tuple(CachedCourse(*row) for row in db.session.query(
+                        models.Course.id, models.Course.course_code, models.Course.course_name).order_by(models.Course.id))
+            body = jsonify({"courses": [course.to_dict() for course in courses]}).get_data()
+            snapshot = CatalogSnapshot(version, courses,
+                                       MappingProxyType({course.course_code: course for course in courses}), body)
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def _current_version(self):
+        return db.session.query(models.VersionStamp.version).filter_by(name='courses').scalar() or 0
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = None
+
+course_catalog = CourseCatalog()
@@ -1,6 +1,24 @@
-from app import models, db
+from app import app, models, db, passwords, replica, trending
+from app.token_cache import revoked_tokens
+from app.course_cache import course_catalog
+from app.like_buffer import like_buffer
+from app.follow_graph import follow_graph
 from flask_jwt_extended import decode_token
+from sqlalchemy import func, and_, or_, select, literal, literal_column, exists, case, bindparam
+from sqlalchemy.sql import table, column
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from datetime import datetime
+import base64
+import calendar
+from collections import defaultdict
+import time
+import re
+from itertools import islice
+
+# Upper bound for the number of ids bound to a single IN clause, kept below the
+# SQLite host parameter limit.
+IN_CLAUSE_CHUNK_SIZE = 500
 
 # - - - USER FUNCTIONS - - -
 
@@ -9,73 +27,715 @@ def register_user(username, email, password):
     db.session.add(user)
     db.session.commit()
 
+# Rehashes the password of user when its stored hash was made with other
+# parameters than the configured ones, called after a successful login.
+def upgrade_password_hash(user, password):
+    if passwords.needs_rehash(user.password_hash):
+        user.set_password(password)
+        db.session.commit()
+
 def get_user_by_username(username):
     return db.session.query(models.User).filter_by(username=username).first()
 
 def get_user_by_email(email):
     return db.session.query(models.User).filter_by(email=email).first()
 
-def get_all_users(user):
-    return db.session.query(models.User).filter(models.User.username != user.username).all()
+def get_user_by_id(id):
+    return db.session.query(models.User).filter_by(id=id).first()
+
+# With stream the users are returned as an iterator that reads them from the
+# database in batches, see _stream. Read from the replica when configured,
+# see app/replica.py.
+def get_all_users(user, stream=False):
+    query = replica.reader().query(models.User).filter(models.User.id != user.id)
+    return _stream(query) if stream else query.all()
 
 # - - - FOLLOW FUNCTIONS - - -
 
-def get_all_followed_users(following_user):
-    return following_user.followed.all()
+# The follow functions only use the id of following_user, so it can be the
+# CurrentUser of a request as well as a User.
+
+def get_all_followed_users(following_user, stream=False):
+    query = replica.reader().query(models.User).join(models.followers,
+                (models.followers.c.followed_id == models.User.id)).filter(
+                    models.followers.c.follower_id == following_user.id)
+    return _stream(query) if stream else query.all()
+
+def _is_following(follower_id, followed_id):
+    return db.session.query(exists().where(and_(
+                models.followers.c.follower_id == follower_id,
+                models.followers.c.followed_id == followed_id))).scalar()
+
+# Runs write, a function that checks which rows exist and then inserts the
+# others, once more if a concurrent request inserted one of the rows between
+# the check and the insert. The unique index then rejects the insert, and the
+# second run finds the row and does not insert or count it again.
+def _retry_on_conflict(write, *args):
+    try:
+        return write(*args)
+    except IntegrityError:
+        db.session.rollback()
+        return write(*args)
 
 def add_follow_relationship(following_user, followed_user):
-    following_user.follow(followed_user)
-    db.session.commit()
+    _retry_on_conflict(_add_follow_relationship, following_user, followed_user)
+
+def _add_follow_relationship(following_user, followed_user):
+    followed_ids = [] if _is_following(following_user.id, followed_user.id) else [followed_user.id]
+    _insert_follows(following_user, followed_ids)
+    _commit_follows(following_user, followed_ids, True)
 
 def remove_follow_relationship(following_user, unfollowed_user):
-    following_user.unfollow(unfollowed_user)
+    unfollowed_ids = [unfollowed_user.id] if _is_following(following_user.id, unfollowed_user.id) else []
+    _delete_follows(following_user, unfollowed_ids)
+    _commit_follows(following_user, unfollowed_ids, False)
+
+# Commits the follows (following is True) or unfollows and only then records
+# them in the follower graph, so a rebuild of the graph running meanwhile
+# does not drop them and a rolled back follow is never recorded.
+def _commit_follows(following_user, user_ids, following):
+    db.session.commit()
+    if user_ids:
+        follow_graph.record(following_user.id, user_ids, following)
+
+# Adds follow relationships from following_user to the users with the ids in
+# followed_ids, which must not be followed already, with one multi-row INSERT.
+def _insert_follows(following_user, followed_ids):
+    if not followed_ids:
+        return
+    db.session.execute(models.followers.insert().values(
+            [{"follower_id": following_user.id, "followed_id": followed_id} for followed_id in followed_ids]))
+    following_user._followed_ids = None
+    if app.config['FEED_TIMELINE_ENABLED']:
+        _backfill_timeline(following_user, followed_ids)
+
+def _delete_follows(following_user, unfollowed_ids):
+    if not unfollowed_ids:
+        return
+    db.session.execute(models.followers.delete().where(and_(
+            models.followers.c.follower_id == following_user.id,
+            models.followers.c.followed_id.in_(unfollowed_ids))))
+    following_user._followed_ids = None
+    if app.config['FEED_TIMELINE_ENABLED']:
+        _trim_timeline(following_user, unfollowed_ids)
+
+# Looks up the users with the provided usernames together with whether
+# following_user follows them, in a single query. Returns a dict from the
+# usernames that exist to (user id, is followed).
+def _get_follow_states(following_user, usernames):
+    states = {}
+    for chunk in _chunks(list(set(usernames))):
+        rows = db.session.query(models.User.id, models.User.username, models.followers.c.follower_id).outerjoin(
+                    models.followers, and_(models.followers.c.followed_id == models.User.id,
+                                           models.followers.c.follower_id == following_user.id)).filter(
+                    models.User.username.in_(chunk))
+        for user_id, username, follower_id in rows:
+            states[username] = (user_id, follower_id is not None)
+    return states
+
+# following_user follows all the users with the provided usernames in one
+# transaction. Returns a list of (username, status) in the order of usernames,
+# where status is 'followed', 'already_followed' or 'not_found'.
+def follow_users(following_user, usernames):
+    return _retry_on_conflict(_follow_users, following_user, usernames)
+
+def _follow_users(following_user, usernames):
+    states = _get_follow_states(following_user, usernames)
+    results = []
+    followed_ids = []
+    for username in usernames:
+        if username not in states:
+            results.append((username, 'not_found'))
+            continue
+        user_id, is_followed = states[username]
+        if is_followed:
+            results.append((username, 'already_followed'))
+        else:
+            results.append((username, 'followed'))
+            if user_id not in followed_ids:
+                followed_ids.append(user_id)
+    _insert_follows(following_user, followed_ids)
+    _commit_follows(following_user, followed_ids, True)
+    return results
+
+# The reverse of follow_users, with the statuses 'unfollowed', 'not_followed'
+# and 'not_found'.
+def unfollow_users(following_user, usernames):
+    states = _get_follow_states(following_user, usernames)
+    results = []
+    unfollowed_ids = []
+    for username in usernames:
+        if username not in states:
+            results.append((username, 'not_found'))
+            continue
+        user_id, is_followed = states[username]
+        if is_followed:
+            results.append((username, 'unfollowed'))
+            if user_id not in unfollowed_ids:
+                unfollowed_ids.append(user_id)
+        else:
+            results.append((username, 'not_followed'))
+    _delete_follows(following_user, unfollowed_ids)
+    _commit_follows(following_user, unfollowed_ids, False)
+    return results
+
+# Suggests up to limit users for user to follow from the in memory follower
+# graph, see app/follow_graph.py. Returns a list of (user, mutual follows,
+# shared courses), best first.
+def get_follow_suggestions(user, limit):
+    ranked = follow_graph.suggest(user.id, limit)
+    if not ranked:
+        return []
+    users = {suggested.id: suggested for suggested in db.session.query(models.User).filter(
+                models.User.id.in_([user_id for user_id, _, _ in ranked]))}
+    return [(users[user_id], mutual, shared) for user_id, mutual, shared in ranked if user_id in users]
+
+# - - - TIMELINE FUNCTIONS - - -
+
+# Pushes question into the timelines of all the followers of its author.
+def _fan_out_question(question):
+    timeline = models.TimelineEntry.__table__
+    followers = select([models.followers.c.follower_id, literal(question.id), literal(question.timestamp)]).where(
+                    models.followers.c.followed_id == question.user_id).distinct()
+    db.session.execute(timeline.insert().from_select(['user_id', 'question_id', 'timestamp'], followers))
+
+# Adds the questions of the users with the ids in followed_ids to the timeline
+# of following_user, skipping questions that are already in it.
+def _backfill_timeline(following_user, followed_ids):
+    timeline = models.TimelineEntry.__table__
+    question = models.Question.__table__
+    questions = select([literal(following_user.id), question.c.id, question.c.timestamp]).where(and_(
+                    question.c.user_id.in_(followed_ids),
+                    ~exists().where(and_(timeline.c.user_id == following_user.id, timeline.c.question_id == question.c.id))))
+    db.session.execute(timeline.insert().from_select(['user_id', 'question_id', 'timestamp'], questions))
+
+# Removes the questions of the users with the ids in unfollowed_ids from the
+# timeline of following_user.
+def _trim_timeline(following_user, unfollowed_ids):
+    timeline = models.TimelineEntry.__table__
+    questions = select([models.Question.id]).where(models.Question.user_id.in_(unfollowed_ids))
+    db.session.execute(timeline.delete().where(and_(
+                    timeline.c.user_id == following_user.id, timeline.c.question_id.in_(questions))))
+
+# Regenerates all timelines from the followers and question tables and returns
+# the number of timeline entries.
+def rebuild_timelines():
+    timeline = models.TimelineEntry.__table__
+    question = models.Question.__table__
+    entries = select([models.followers.c.follower_id, question.c.id, question.c.timestamp]).select_from(
+                    question.join(models.followers, models.followers.c.followed_id == question.c.user_id)).distinct()
+    db.session.execute(timeline.delete())
+    db.session.execute(timeline.insert().from_select(['user_id', 'question_id', 'timestamp'], entries))
     db.session.commit()
+    return db.session.query(models.TimelineEntry).count()
 
 # - - - QUESTION FUNCTIONS - - -
 
+# course_room can be a course from the course catalog cache, only its id is used
 def add_question(question_title, question_body, user, course_room):
-    question = models.Question(question_title, question_body, user, course_room)
+    question = models.Question(question_title, question_body, user, course_room.id)
+    question.hot_score = trending.current_weight(app.config['TRENDING_QUESTION_WEIGHT'])
     db.session.add(question)
+    if app.config['FEED_TIMELINE_ENABLED']:
+        db.session.flush()
+        _fan_out_question(question)
     db.session.commit()
 
+def _is_liking_question(user_id, question_id):
+    return db.session.query(exists().where(and_(
+                models.question_likes.c.liker_id == user_id,
+                models.question_likes.c.liked_id == question_id))).scalar()
+
+# Only the id of user is used, so it can be the CurrentUser of a request.
+# With LIKE_WRITE_BEHIND_ENABLED the like is buffered and written later, see
+# app/like_buffer.py.
 def like_question(user, question):
-    user.like_question(question)
+    if app.config['LIKE_WRITE_BEHIND_ENABLED']:
+        like_buffer.record(user.id, [question.id], True)
+        return
+    _retry_on_conflict(_like_question, user, question.id)
+
+# Only inserts and counts the like if it is not there, see _retry_on_conflict
+def _like_question(user, question_id):
+    if not _is_liking_question(user.id, question_id):
+        _insert_likes(user, [question_id])
     db.session.commit()
 
 def unlike_question(user, question):
-    user.unlike_question(question)
+    if app.config['LIKE_WRITE_BEHIND_ENABLED']:
+        like_buffer.record(user.id, [question.id], False)
+        return
+    like_weights = _get_like_weights(user.id, [question.id])
+    if like_weights:
+        _delete_likes(user, [question.id], like_weights)
+    db.session.commit()
+
+# Whether user likes the question according to the buffered likes, None if
+# no like or unlike of the question by user is buffered.
+def get_buffered_like(user, question_id):
+    try:
+        question_id = int(question_id)
+    except (TypeError, ValueError):
+        return None
+    return like_buffer.pending_states(user.id, [question_id]).get(question_id)
+
+# Adds likes by user to the questions with the ids in question_ids, which
+# must not be liked already, with one multi-row INSERT.
+def _insert_likes(user, question_ids):
+    if not question_ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(models.question_likes.insert().values(
+            [{"liker_id": user.id, "liked_id": question_id, "timestamp": now} for question_id in question_ids]))
+    weight = _like_weight(now, trending.trending_epoch.get())
+    _increment_counters_of_questions(question_ids, like_count=1,
+                                     hot_deltas={question_id: weight for question_id in question_ids})
+
+# Removes the likes by user of the questions with the ids in question_ids,
+# like_weights are the hot scores the likes added, see _get_like_weights.
+def _delete_likes(user, question_ids, like_weights=None):
+    if not question_ids:
+        return
+    if like_weights is None:
+        like_weights = _get_like_weights(user.id, question_ids)
+    db.session.execute(models.question_likes.delete().where(and_(
+            models.question_likes.c.liker_id == user.id,
+            models.question_likes.c.liked_id.in_(question_ids))))
+    _increment_counters_of_questions(question_ids, like_count=-1,
+                                     hot_deltas={question_id: -weight for question_id, weight in like_weights.items()})
+
+# The hot score that each like by the user with id liker_id of the questions
+# with the ids in question_ids added, as a dict from the ids of the liked
+# questions. It is the like weight decayed from when the question was liked.
+def _get_like_weights(liker_id, question_ids):
+    liked_at = func.coalesce(models.question_likes.c.timestamp, models.Question.timestamp)
+    epoch = trending.trending_epoch.get()
+    weights = {}
+    for chunk in _chunks(question_ids):
+        rows = db.session.query(models.question_likes.c.liked_id, liked_at).join(
+                    models.Question, models.Question.id == models.question_likes.c.liked_id).filter(
+                    models.question_likes.c.liker_id == liker_id, models.question_likes.c.liked_id.in_(chunk))
+        for question_id, timestamp in rows:
+            weights[question_id] = _like_weight(timestamp, epoch)
+    return weights
+
+# The hot score of a like made at timestamp relative to epoch
+def _like_weight(timestamp, epoch):
+    return app.config['TRENDING_LIKE_WEIGHT'] * trending.decay_factor(_utc_seconds(timestamp), epoch)
+
+# Seconds since the unix epoch of a naive UTC datetime, now if it is None
+def _utc_seconds(timestamp):
+    if timestamp is None:
+        return time.time()
+    return calendar.timegm(timestamp.utctimetuple()) + timestamp.microsecond / 1e6
+
+# Looks up which of the questions with the provided ids exist and whether
+# user likes them, in a single query. Returns a dict from the ids of the
+# questions that exist to is liked, including the buffered likes of user.
+def _get_like_states(user, question_ids):
+    states = {}
+    for chunk in _chunks(list(set(question_ids))):
+        rows = db.session.query(models.Question.id, models.question_likes.c.liker_id).outerjoin(
+                    models.question_likes, and_(models.question_likes.c.liked_id == models.Question.id,
+                                                models.question_likes.c.liker_id == user.id)).filter(
+                    models.Question.id.in_(chunk))
+        for question_id, liker_id in rows:
+            states[question_id] = liker_id is not None
+    for question_id, liked in like_buffer.pending_states(user.id, states).items():
+        states[question_id] = liked
+    return states
+
+# Question ids that are not JSON integers or strings of digits can not exist,
+# booleans and floats are not ids even though int() accepts them
+def _parse_question_ids(question_ids):
+    parsed = []
+    for question_id in question_ids:
+        if isinstance(question_id, int) and not isinstance(question_id, bool):
+            parsed.append(question_id)
+        elif isinstance(question_id, str) and question_id.isascii() and question_id.isdigit():
+            parsed.append(int(question_id))
+        else:
+            parsed.append(None)
+    return parsed
+
+# user likes all the questions with the provided ids in one transaction.
+# Returns a list of (question id, status) in the order of question_ids, where
+# status is 'liked', 'already_liked' or 'not_found'. Liking the same questions
+# concurrently conflicts on the unique index, the retry reports the likes of
+# the other request as already liked.
+def like_questions(user, question_ids):
+    return _retry_on_conflict(_like_questions, user, question_ids)
+
+def _like_questions(user, question_ids):
+    parsed_ids = _parse_question_ids(question_ids)
+    states = _get_like_states(user, [question_id for question_id in parsed_ids if question_id is not None])
+    results = []
+    liked_ids = []
+    for question_id, parsed_id in zip(question_ids, parsed_ids):
+        if parsed_id not in states:
+            results.append((question_id, 'not_found'))
+        elif states[parsed_id]:
+            results.append((question_id, 'already_liked'))
+        else:
+            results.append((question_id, 'liked'))
+            if parsed_id not in liked_ids:
+                liked_ids.append(parsed_id)
+    if app.config['LIKE_WRITE_BEHIND_ENABLED']:
+        like_buffer.record(user.id, liked_ids, True)
+        return results
+    _insert_likes(user, liked_ids)
+    db.session.commit()
+    return results
+
+# The reverse of like_questions, with the statuses 'unliked', 'not_liked' and
+# 'not_found'.
+def unlike_questions(user, question_ids):
+    parsed_ids = _parse_question_ids(question_ids)
+    states = _get_like_states(user, [question_id for question_id in parsed_ids if question_id is not None])
+    results = []
+    unliked_ids = []
+    for question_id, parsed_id in zip(question_ids, parsed_ids):
+        if parsed_id not in states:
+            results.append((question_id, 'not_found'))
+        elif states[parsed_id]:
+            results.append((question_id, 'unliked'))
+            if parsed_id not in unliked_ids:
+                unliked_ids.append(parsed_id)
+        else:
+            results.append((question_id, 'not_liked'))
+    if app.config['LIKE_WRITE_BEHIND_ENABLED']:
+        like_buffer.record(user.id, unliked_ids, False)
+        return results
+    _delete_likes(user, unliked_ids)
     db.session.commit()
+    return results
+
+def _increment_question_counters(question, **deltas):
+    _increment_counters_of_questions([question.id], **deltas)
+
+# Adds the deltas to the stored counters of the questions with the ids in
+# question_ids and bumps their versions with a single UPDATE ... SET n = n + delta,
+# so concurrent updates are not lost. The hot scores change by hot_deltas, a
+# dict from question id to delta, or else by the current weight of the added
+# likes and answers. They do not go below 0 when likes are removed.
+def _increment_counters_of_questions(question_ids, hot_deltas=None, **deltas):
+    hot_delta = None
+    if hot_deltas is None:
+        weight = trending.current_weight(deltas.get('like_count', 0) * app.config['TRENDING_LIKE_WEIGHT'] +
+                                         deltas.get('answer_count', 0) * app.config['TRENDING_ANSWER_WEIGHT'])
+        if weight:
+            hot_delta = weight
+    else:
+        hot_deltas = {question_id: delta for question_id, delta in hot_deltas.items() if delta}
+        if hot_deltas:
+            hot_delta = case(hot_deltas, value=models.Question.id, else_=0.0)
+    deltas['version'] = 1
+    values = {getattr(models.Question, name): getattr(models.Question, name) + delta for name, delta in deltas.items()}
+    if hot_delta is not None:
+        hot_score = models.Question.hot_score + hot_delta
+        values[models.Question.hot_score] = case([(hot_score > 0, hot_score)], else_=0.0)
+    db.session.query(models.Question).filter(models.Question.id.in_(question_ids)).update(
+        values, synchronize_session=False)
+
+# Fetches only the version of the question with the provided id, None if
+# there is no such question. Buffered likes do not change the version.
+def get_question_version(id):
+    return db.session.query(models.Question.version).filter_by(id=id).scalar()
+
+# Recomputes the stored like and answer counts of all questions from the
+# question_likes and answer tables and returns the number of repaired questions.
+def reconcile_question_counters():
+    question = models.Question.__table__
+    likes = select([func.count()]).select_from(models.question_likes).where(
+                models.question_likes.c.liked_id == question.c.id).as_scalar()
+    answers = select([func.count()]).select_from(models.Answer.__table__).where(
+                models.Answer.question_id == question.c.id).as_scalar()
+    result = db.session.execute(question.update().where(
+                or_(question.c.like_count != likes, question.c.answer_count != answers)).values(
+                    like_count=likes, answer_count=answers))
+    db.session.commit()
+    return result.rowcount
 
 def get_question_by_id(id):
-    return db.session.query(models.Question).filter_by(id=id).first()
+    return _question_query().filter_by(id=id).first()
+
+# Query for questions with their author and course loaded in the same round
+# trip, so serializing them does not lazy load per row. The read only lists
+# pass replica.reader() as session, which may be the read replica.
+def _question_query(session=None):
+    return (session or db.session).query(models.Question).options(
+                joinedload(models.Question.author), joinedload(models.Question.course_room))
 
-# Fetches all the questions asked by users followed by user.
-def get_followed_questions(user):
-    return db.session.query(models.Question).join(models.followers,
+# Splits ids into lists small enough to be used in a single IN clause. ids
+# can be any iterable, it is only read one chunk ahead.
+def _chunks(ids):
+    ids = iter(ids)
+    chunk = list(islice(ids, IN_CLAUSE_CHUNK_SIZE))
+    while chunk:
+        yield chunk
+        chunk = list(islice(ids, IN_CLAUSE_CHUNK_SIZE))
+
+# Iterates over the results of query while fetching STREAMING_YIELD_PER rows
+# at a time, so the whole result is never loaded at once. Rows that are no
+# longer referenced are dropped from the session as the iteration goes on.
+def _stream(query):
+    return query.yield_per(app.config['STREAMING_YIELD_PER'])
+
+# Encodes the position of question in a newest first list of questions as an
+# opaque cursor.
+def encode_question_cursor(question):
+    position = "{}|{}".format(question.timestamp.isoformat(), question.id)
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+# Decodes a cursor created by encode_question_cursor, raises ValueError if the
+# cursor is malformed.
+def _decode_question_cursor(cursor):
+    timestamp, question_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(timestamp), int(question_id)
+
+# Orders the questions newest first and returns them together with the cursor
+# of the next page. When limit is given at most limit questions positioned
+# after the cursor are returned. The page is a seek on (timestamp, id) which
+# uses the timestamp index instead of scanning the skipped rows like an OFFSET.
+# The columns to seek on can be given when the questions are ordered through
+# another table holding the same values, like the timeline.
+def _paginate_questions(query, limit=None, cursor=None, stream=False,
+                        timestamp_column=models.Question.timestamp, id_column=models.Question.id):
+    query = query.order_by(timestamp_column.desc(), id_column.desc())
+    if cursor is not None:
+        timestamp, question_id = _decode_question_cursor(cursor)
+        # The redundant timestamp <= bound lets the database start the scan of
+        # a (..., timestamp) index at the cursor instead of at the newest row
+        query = query.filter(timestamp_column <= timestamp, or_(timestamp_column < timestamp,
+                    and_(timestamp_column == timestamp, id_column < question_id)))
+    if limit is None:
+        return (_stream(query) if stream else query.all()), None
+    questions = query.limit(limit + 1).all()
+    if len(questions) > limit:
+        return questions[:limit], encode_question_cursor(questions[limit - 1])
+    return questions, None
+
+# Fetches the questions asked by users followed by user, see
+# _paginate_questions for limit and cursor, and _stream for stream which only
+# applies without a limit. In timeline mode the questions are read from the
+# materialized timeline of user.
+def get_followed_questions(user, limit=None, cursor=None, stream=False):
+    if app.config['FEED_TIMELINE_ENABLED']:
+        query = _question_query(replica.reader()).join(models.TimelineEntry,
+                    (models.TimelineEntry.question_id == models.Question.id)).filter(
+                        models.TimelineEntry.user_id == user.id)
+        return _paginate_questions(query, limit, cursor, stream,
+                    models.TimelineEntry.timestamp, models.TimelineEntry.question_id)
+    query = _question_query(replica.reader()).join(models.followers,
                 (models.followers.c.followed_id == models.Question.user_id)).filter(
-                    models.followers.c.follower_id == user.id).order_by(models.Question.timestamp.desc()).all()
+                    models.followers.c.follower_id == user.id)
+    return _paginate_questions(query, limit, cursor, stream)
+
+# Fetches the questions asked by user, see get_followed_questions for limit,
+# cursor and stream.
+def get_questions_by_user(user, limit=None, cursor=None, stream=False):
+    query = _question_query(replica.reader()).filter(models.Question.user_id == user.id)
+    return _paginate_questions(query, limit, cursor, stream)
+
+# Fetches the questions asked in course, see get_followed_questions for limit,
+# cursor and stream. course can be a course from the course catalog cache.
+def get_questions_by_course(course, limit=None, cursor=None, stream=False):
+    query = _question_query(replica.reader()).filter(models.Question.course_id == course.id)
+    return _paginate_questions(query, limit, cursor, stream)
+
+# Converts questions to dicts as seen by user. The liked state is fetched for
+# all questions at once instead of once per question.
+def get_question_dicts(questions, user):
+    return list(iter_question_dicts(questions, user))
 
-def get_questions_by_user(user):
-    return db.session.query(models.Question).filter(models.Question.user_id == user.id).order_by(models.Question.timestamp.desc()).all()
+# Like get_question_dicts but converts the questions one chunk at a time, the
+# liked state is fetched once per chunk. questions can be a stream. The likes
+# of user that are still buffered are included in is_liking and the like
+# count, compared to the liked state read from the database.
+def iter_question_dicts(questions, user):
+    for chunk in _chunks(questions):
+        liked_ids = set(liked_id for (liked_id,) in replica.reader().query(models.question_likes.c.liked_id).filter(
+                models.question_likes.c.liker_id == user.id,
+                models.question_likes.c.liked_id.in_([question.id for question in chunk])))
+        pending = like_buffer.pending_states(user.id, [question.id for question in chunk])
+        for question in chunk:
+            question_dict = question.to_dict()
+            is_liking = question.id in liked_ids
+            if question.id in pending:
+                question_dict["likes"] += pending[question.id] - is_liking
+                is_liking = pending[question.id]
+            question_dict["is_liking"] = "{}".format(is_liking)
+            yield question_dict
+
+# - - - SEARCH FUNCTIONS - - -
+
+SEARCH_MAX_TERMS = 16
+_search_term = re.compile(r'\w+')
+
+# Splits the search text of a user into words. Only the words are passed on
+# to the full text search, so the text can not contain query syntax.
+def get_search_terms(text):
+    return _search_term.findall(text or '')[:SEARCH_MAX_TERMS]
+
+# Fetches the questions that contain all the terms in their title or body,
+# best match first, optionally only the questions in course. Returns the
+# questions and the offset of the next page, None on the last page.
+#
+# SQLite ranks with bm25 over the question_fts table and Postgres with
+# ts_rank_cd over the GIN indexed search vector, in both a match in the title
+# counts more than one in the body. Other databases fall back to a slow
+# substring search ordered by time.
+def search_questions(terms, course=None, limit=20, offset=0):
+    dialect = db.engine.dialect.name
+    session = replica.reader()
+    if dialect == 'sqlite':
+        fts = table('question_fts', column('rowid'))
+        match = ' '.join('"{}"'.format(term) for term in terms)
+        query = _question_query(session).join(fts, fts.c.rowid == models.Question.id).filter(
+                    literal_column('question_fts').op('MATCH')(match)).order_by(
+                        func.bm25(literal_column('question_fts'), 10.0, 1.0), models.Question.id.desc())
+    elif dialect == 'postgresql':
+        vector = literal_column('(' + models.QUESTION_SEARCH_VECTOR + ')')
+        tsquery = func.plainto_tsquery(literal_column("'english'"), ' '.join(terms))
+        query = _question_query(session).filter(vector.op('@@')(tsquery)).order_by(
+                    func.ts_rank_cd(vector, tsquery).desc(), models.Question.id.desc())
+    else:
+        query = _question_query(session).filter(and_(*[or_(models.Question.question_title.ilike('%' + term + '%'),
+                                                     models.Question.question_body.ilike('%' + term + '%'))
+                                                for term in terms])).order_by(
+                    models.Question.timestamp.desc(), models.Question.id.desc())
+    if course is not None:
+        query = query.filter(models.Question.course_id == course.id)
+    questions = query.limit(limit + 1).offset(offset).all()
+    if len(questions) > limit:
+        return questions[:limit], offset + limit
+    return questions, None
+
+# The questions with the highest hot score first, in all course rooms or in
+# course. Both orders are served by an index, so a page is an index scan.
+def get_trending_questions(course=None, limit=20, offset=0):
+    query = _question_query(replica.reader())
+    if course is not None:
+        query = query.filter(models.Question.course_id == course.id)
+    questions = query.order_by(models.Question.hot_score.desc(), models.Question.id.desc()).limit(
+                    limit + 1).offset(offset).all()
+    if len(questions) > limit:
+        return questions[:limit], offset + limit
+    return questions, None
+
+# Moves the trending epoch to the current time and scales the hot scores of
+# all questions down accordingly, which keeps their order and their values
+# small. With rebuild, or if there is no epoch yet, the scores are instead
+# recomputed from the likes and the answer counts, counting the answers, and
+# likes from before likes had a timestamp, as if they were made when the
+# question was asked. Returns the number of updated questions.
+def rescore_trending(rebuild=False):
+    now = time.time()
+    epoch = trending.epoch_minutes(now)
+    stamp = db.session.query(models.VersionStamp).filter_by(name=trending.EPOCH_STAMP).first()
+    if stamp is None:
+        stamp = models.VersionStamp(trending.EPOCH_STAMP, epoch)
+        db.session.add(stamp)
+        rebuild = True
+    if rebuild:
+        updated = _rebuild_hot_scores(epoch)
+    else:
+        factor = trending.decay_factor(stamp.version * 60, epoch)
+        updated = db.session.query(models.Question).update(
+            {models.Question.hot_score: models.Question.hot_score * factor}, synchronize_session=False)
+    stamp.version = epoch
+    db.session.commit()
+    trending.trending_epoch.invalidate()
+    return updated
+
+def _rebuild_hot_scores(epoch):
+    question = models.Question.__table__
+    update = question.update().where(question.c.id == bindparam('question_id')).values(
+                hot_score=bindparam('score'))
+    rows = db.session.query(models.Question.id, models.Question.timestamp,
+                            models.Question.answer_count).order_by(models.Question.id)
+    liked_at = func.coalesce(models.question_likes.c.timestamp, models.Question.timestamp)
+    updated = 0
+    for chunk in _chunks(_stream(rows)):
+        like_scores = defaultdict(float)
+        likes = db.session.query(models.question_likes.c.liked_id, liked_at).join(
+                    models.Question, models.Question.id == models.question_likes.c.liked_id).filter(
+                    models.question_likes.c.liked_id.in_([question_id for question_id, _, _ in chunk]))
+        for question_id, timestamp in likes:
+            like_scores[question_id] += trending.decay_factor(_utc_seconds(timestamp), epoch)
+        scores = []
+        for question_id, timestamp, answer_count in chunk:
+            asked = trending.decay_factor(_utc_seconds(timestamp), epoch)
+            score = ((app.config['TRENDING_QUESTION_WEIGHT'] + answer_count * app.config['TRENDING_ANSWER_WEIGHT']) * asked +
+                     app.config['TRENDING_LIKE_WEIGHT'] * like_scores[question_id])
+            scores.append({"question_id": question_id, "score": score})
+        db.session.execute(update, scores)
+        updated += len(scores)
+    return updated
 
 # - - - ANSWER FUNCTIONS - - -
 
 def add_answer(answer_body, user, parent_question):
     answer = models.Answer(answer_body, user, parent_question)
     db.session.add(answer)
+    _increment_question_counters(parent_question, answer_count=1)
     db.session.commit()
 
-# Fetches all the answers for a question.
-def get_question_answers(question):
-    return db.session.query(models.Answer).filter(models.Answer.question_id == question.id).all()
+# Fetches all the answers for a question together with their authors, see
+# _stream for stream.
+def get_question_answers(question, stream=False):
+    query = replica.reader().query(models.Answer).options(joinedload(models.Answer.author)).filter(
+                models.Answer.question_id == question.id).order_by(models.Answer.timestamp, models.Answer.id)
+    return _stream(query) if stream else query.all()
 
 # - - - COURSE FUNCTIONS - - -
 
+def add_course(course_code, course_name):
+    db.session.add(models.Course(course_code, course_name))
+    commit_course_change()
+
+# The questions of the course are serialized with its name, their versions
+# are bumped so their ETags change with it
+def update_course(course_code, course_name):
+    updated = db.session.query(models.Course).filter_by(course_code=course_code).update(
+        {models.Course.course_name: course_name}, synchronize_session=False)
+    course_ids = select([models.Course.id]).where(models.Course.course_code == course_code)
+    db.session.query(models.Question).filter(models.Question.course_id.in_(course_ids)).update(
+        {models.Question.version: models.Question.version + 1}, synchronize_session=False)
+    commit_course_change()
+    return updated > 0
+
+# Every change to the course table has to go through here, or be followed by
+# a call to it, for the course catalog caches of all processes to see it.
+def commit_course_change():
+    _bump_version('courses')
+    db.session.commit()
+    course_catalog.invalidate()
+
+# The courses are served from the course catalog cache, they are read only
+# CachedCourse tuples and not Course models.
 def get_all_courses():
-    return db.session.query(models.Course).all()
+    return course_catalog.get().courses
 
 def get_course_by_code(course_code):
-    return db.session.query(models.Course).filter_by(course_code=course_code).first()
+    return course_catalog.get().by_code.get(course_code)
+
+# The /courses response body, serialized when the catalog was loaded
+def get_courses_body():
+    snapshot = course_catalog.get()
+    return snapshot.version, snapshot.body
+
+# - - - VERSION FUNCTIONS - - -
+
+def get_version(name):
+    return db.session.query(models.VersionStamp.version).filter_by(name=name).scalar() or 0
+
+# Bumps the version of name in the current transaction
+def _bump_version(name):
+    updated = db.session.query(models.VersionStamp).filter_by(name=name).update(
+        {models.VersionStamp.version: models.VersionStamp.version + 1}, synchronize_session=False)
+    if not updated:
+        db.session.add(models.VersionStamp(name))
 
 # - - - TOKEN FUNCTIONS - - -
 
@@ -92,9 +752,14 @@ def add_token_to_blacklist(encoded_token, identity_claim):
     token = models.Token(jti, token_type, user_identity, expires)
     db.session.add(token)
     db.session.commit()
+    revoked_tokens.add(jti, expires)
 
+# Checks the revoked token cache when it is enabled, the token table is then
+# only read when the cache is refreshed.
 def is_token_revoked(decoded_token):
     jti = decoded_token['jti']
+    if app.config['JWT_REVOCATION_CACHE_ENABLED']:
+        return revoked_tokens.is_revoked(jti)
     token = db.session.query(models.Token).filter_by(jti=jti).first()
     if token is not None:
         return True
@@ -106,7 +771,13 @@ def init_db():
     db.session.commit()
     db.drop_all()
     db.create_all()
-    db.session.add(models.Course("TDDD80", "Mobile and Social Applications"))
-    db.session.add(models.Course("TDDC73", "Interaction Programming"))
-    db.session.add(models.Course("TATA24", "Linear Algebra"))
-    db.session.commit()
+    revoked_tokens.clear()
+    course_catalog.invalidate()
+    replica.clear_sticky_users()
+    like_buffer.clear()
+    follow_graph.invalidate()
+    trending.trending_epoch.invalidate()
+    db.session.add(models.VersionStamp(trending.EPOCH_STAMP, trending.epoch_minutes(time.time())))
+    add_course("TDDD80", "Mobile and Social Applications")
+    add_course("TDDC73", "Interaction Programming")
+    add_course("TATA24", "Linear Algebra")
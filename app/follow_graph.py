@@ -0,0 +1,179 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import defaultdict, namedtuple
+from sqlalchemy import func
+from app import app, db, models
+
+# Process local copy of the followers table and of the courses the users ask
+# questions in, used to suggest users to follow without querying the
+# followers table.
+#
+# The graph is stored as CSR (compressed sparse row) int arrays, the followed
+# user ids of the user with id u are following.indices[indptr[u]:indptr[u + 1]].
+# It is rebuilt from the database every SUGGESTIONS_REFRESH_SECONDS by a
+# background thread, which is also how follows made by other worker
+# processes and new questions are picked up. Follows and unfollows made by
+# this process are recorded in an overlay on top of the arrays until the next
+# rebuild includes them.
+
+# Rows of a CSR matrix with int columns, rows out of range are empty
+class CSR(namedtuple('CSR', ['indptr', 'indices'])):
+    __slots__ = ()
+
+    def row(self, i):
+        if i >= len(self.indptr) - 1:
+            return ()
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+# Builds a CSR from (row, column) pairs ordered by row, with as many rows as
+# the largest row of the pairs needs
+def build_csr(pairs):
+    counts = array('i')
+    indices = array('i')
+    for row, column in pairs:
+        if row >= len(counts):
+            counts.extend(array('i', [0]) * (row + 1 - len(counts)))
+        counts[row] += 1
+        indices.append(column)
+    indptr = array('i', [0]) * (len(counts) + 1)
+    for i, count in enumerate(counts):
+        indptr[i + 1] = indptr[i] + count
+    return CSR(indptr, indices)
+
+logger = logging.getLogger(__name__)
+
+# following: user id -> followed user ids. courses_of_user: user id -> ids of
+# the courses the user asked in. users_of_course: course id -> ids of the
+# SUGGESTIONS_COURSE_PEERS users that asked the most questions in the course.
+GraphSnapshot = namedtuple('GraphSnapshot', ['following', 'courses_of_user', 'users_of_course', 'built_at'])
+
+class FollowGraph(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        # follower id -> {followed id: (is following, sequence number)}, rows
+        # are replaced and never changed in place so they can be read without
+        # the lock
+        self._changes = {}
+        self._sequence = 0
+        self._thread = None
+        self._thread_pid = None
+
+    # The current graph. It is only built in the request when there is none
+    # yet, the periodic rebuilds run in the refresher thread.
+    def get(self):
+        self._ensure_refresher()
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot or self._load()
+        return snapshot
+
+    def load(self):
+        with self._lock:
+            return self._load()
+
+    # Starts the refresher thread of this process, called by the
+    # post_worker_init hook of gunicorn.conf.py and on first use
+    def start(self):
+        self._ensure_refresher()
+
+    # A thread of the process gunicorn forked the worker from does not run in
+    # the worker, so the refresher is started once in each process
+    def _ensure_refresher(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='follow-graph-refresher', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    # Rebuilds the graph every SUGGESTIONS_REFRESH_SECONDS and swaps it in
+    # when done, requests keep using the old graph meanwhile
+    def _run(self):
+        while True:
+            time.sleep(app.config['SUGGESTIONS_REFRESH_SECONDS'])
+            try:
+                with app.app_context():
+                    self.load()
+            except Exception:
+                logger.exception('Could not rebuild the follower graph')
+
+    # Reads the followers and question tables into new arrays. Changes recorded
+    # before the tables are read are in the arrays and dropped from the overlay.
+    def _load(self):
+        sequence = self._sequence
+        # The arrays are sized from the rows read, users and courses added
+        # by other workers while they are read are included
+        following = build_csr(db.session.query(models.followers.c.follower_id, models.followers.c.followed_id).order_by(
+                        models.followers.c.follower_id, models.followers.c.followed_id))
+        activity = db.session.query(models.Question.user_id, models.Question.course_id, func.count()).filter(
+                        models.Question.user_id.isnot(None), models.Question.course_id.isnot(None)).group_by(
+                            models.Question.user_id, models.Question.course_id).all()
+        courses_of_user = build_csr(sorted((user_id, course_id) for user_id, course_id, _ in activity))
+        peers = defaultdict(list)
+        for user_id, course_id, count in activity:
+            peers[course_id].append((-count, user_id))
+        limit = app.config['SUGGESTIONS_COURSE_PEERS']
+        users_of_course = build_csr(((course_id, user_id) for course_id in sorted(peers)
+                                     for _, user_id in sorted(peers[course_id])[:limit]))
+        snapshot = GraphSnapshot(following, courses_of_user, users_of_course, time.monotonic())
+        self._changes = {follower_id: row for follower_id, row in (
+                            (follower_id, {followed_id: change for followed_id, change in row.items() if change[1] > sequence})
+                            for follower_id, row in self._changes.items()) if row}
+        self._snapshot = snapshot
+        return snapshot
+
+    # Records follows (following is True) or unfollows of the users with the ids
+    # in followed_ids by the user with id follower_id, once they are committed
+    def record(self, follower_id, followed_ids, following):
+        with self._lock:
+            self._sequence += 1
+            row = dict(self._changes.get(follower_id, {}))
+            for followed_id in followed_ids:
+                row[followed_id] = (following, self._sequence)
+            self._changes[follower_id] = row
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self._changes = {}
+
+    # The ids of the users followed by user_id, with the overlay applied
+    def _followed(self, snapshot, user_id):
+        changes = self._changes.get(user_id)
+        if not changes:
+            return snapshot.following.row(user_id)
+        followed = [followed_id for followed_id in snapshot.following.row(user_id) if followed_id not in changes]
+        followed.extend(followed_id for followed_id, (following, _) in changes.items() if following)
+        return followed
+
+    # Returns up to limit (user id, mutual follows, shared courses) tuples of
+    # users that user_id does not follow, best first. A user is scored by how
+    # many of the users followed by user_id follow it, plus
+    # SUGGESTIONS_COURSE_WEIGHT for each course both asked questions in.
+    def suggest(self, user_id, limit):
+        snapshot = self.get()
+        followed = set(self._followed(snapshot, user_id))
+        mutual = defaultdict(int)
+        for followed_id in followed:
+            for candidate_id in self._followed(snapshot, followed_id):
+                mutual[candidate_id] += 1
+        shared = defaultdict(int)
+        for course_id in snapshot.courses_of_user.row(user_id):
+            for candidate_id in snapshot.users_of_course.row(course_id):
+                shared[candidate_id] += 1
+        course_weight = app.config['SUGGESTIONS_COURSE_WEIGHT']
+        candidates = (candidate_id for candidate_id in mutual.keys() | shared.keys()
+                      if candidate_id != user_id and candidate_id not in followed)
+        best = heapq.nlargest(limit, candidates,
+                              key=lambda candidate_id: (mutual[candidate_id] + course_weight * shared[candidate_id], -candidate_id))
+        return [(candidate_id, mutual[candidate_id], shared[candidate_id]) for candidate_id in best]
+
+follow_graph = FollowGraph()
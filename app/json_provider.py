@@ -0,0 +1,88 @@
+import logging
+from datetime import date, datetime
+from flask import jsonify as flask_jsonify
+from werkzeug.http import http_date
+from app import app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Encoding of the JSON responses of the API. The encoder is selected with
+# JSON_PROVIDER, 'stdlib' uses the encoder of Flask and 'orjson' uses orjson,
+# which is a lot faster on the long lists. If orjson is not installed the
+# stdlib provider is used instead.
+#
+# Both providers print the JSON compactly with sorted keys and format
+# datetimes like Flask, e.g. "Sat, 17 Oct 2026 10:00:00 GMT". orjson does not
+# escape non ASCII characters, the JSON is UTF-8 encoded instead.
+
+logger = logging.getLogger(__name__)
+
+class StdlibJSONProvider(object):
+    name = 'stdlib'
+
+    # Returns a function that encodes objects with the options that
+    # flask.json.dumps would otherwise look up on every call.
+    def make_encoder(self):
+        encoder = app.json_encoder(sort_keys=app.config['JSON_SORT_KEYS'], ensure_ascii=app.config['JSON_AS_ASCII'],
+                                   separators=(',', ':'))
+        return encoder.encode
+
+    def dumps(self, obj):
+        return self.make_encoder()(obj)
+
+# The objects orjson does not encode like the stdlib provider, the same
+# conversions as Flask's JSONEncoder.
+def _orjson_default(o):
+    if isinstance(o, datetime):
+        return http_date(o.utctimetuple())
+    if isinstance(o, date):
+        return http_date(o.timetuple())
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(o).__name__))
+
+class OrjsonJSONProvider(object):
+    name = 'orjson'
+
+    def make_encoder(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if app.config['JSON_SORT_KEYS']:
+            options |= orjson.OPT_SORT_KEYS
+        return lambda obj: orjson.dumps(obj, default=_orjson_default, option=options).decode()
+
+    def dumps(self, obj):
+        return self.make_encoder()(obj)
+
+_providers = {'stdlib': StdlibJSONProvider()}
+if orjson is not None:
+    _providers['orjson'] = OrjsonJSONProvider()
+_warned = set()
+
+# The provider selected with JSON_PROVIDER, or the stdlib provider if it is
+# not available.
+def get_provider():
+    name = app.config['JSON_PROVIDER']
+    provider = _providers.get(name)
+    if provider is None:
+        if name not in _warned:
+            _warned.add(name)
+            logger.warning('JSON provider %r is not available, using the stdlib provider', name)
+        provider = _providers['stdlib']
+    return provider
+
+def dumps(obj):
+    return get_provider().dumps(obj)
+
+# Replaces flask.jsonify for the routes, the response is the same apart from
+# the differences between the providers described above. Indented output for
+# debugging is always made by flask.jsonify.
+def jsonify(*args, **kwargs):
+    if app.config['JSONIFY_PRETTYPRINT_REGULAR'] or app.debug:
+        return flask_jsonify(*args, **kwargs)
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else args or kwargs
+    return app.response_class(dumps(data) + '\n', mimetype=app.config['JSONIFY_MIMETYPE'])
@@ -0,0 +1,172 @@
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import datetime
+from flask import has_app_context
+from sqlalchemy import and_
+from app import app, db, models, trending
+
+# Write behind buffer of the likes, used with LIKE_WRITE_BEHIND_ENABLED.
+#
+# Likes and unlikes are recorded in this process as the state the user wants
+# for each (user, question) and return without touching the database, so
+# toggling a like several times before a flush is one write or none. Every
+# LIKE_FLUSH_INTERVAL_SECONDS a background thread writes the buffered states
+# with one multi-row INSERT, a DELETE per user and one counter UPDATE per
+# distinct delta, in one transaction. A failed flush is retried with the next
+# one.
+#
+# The requests of the same user served by this process see their buffered
+# likes, through pending_states, in the is_liking and likes of the questions
+# and in the statuses of the batch routes. Other processes see them once they
+# are flushed. The buffer is flushed when the process exits.
+
+logger = logging.getLogger(__name__)
+
+class LikeBuffer(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (user id, question id) -> whether the user likes the question
+        self._pending = {}
+        self._thread = None
+        self._thread_pid = None
+        self._stop = threading.Event()
+
+    # Records that the user likes or does not like the questions
+    def record(self, user_id, question_ids, liked):
+        with self._lock:
+            for question_id in question_ids:
+                self._pending[(user_id, question_id)] = liked
+            pending = len(self._pending)
+        self._ensure_flusher()
+        # Flushes in the request when the flusher does not keep up
+        if pending >= app.config['LIKE_BUFFER_MAX_PENDING']:
+            self.flush()
+
+    # The buffered like states of the user for the questions with the provided
+    # ids, as a dict from question id to liked
+    def pending_states(self, user_id, question_ids):
+        with self._lock:
+            if not self._pending:
+                return {}
+            return {question_id: self._pending[(user_id, question_id)] for question_id in question_ids
+                    if (user_id, question_id) in self._pending}
+
+    def __len__(self):
+        return len(self._pending)
+
+    # Drops the buffered likes without writing them
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+    # The flusher thread is started on first use in each process, a thread of
+    # the process gunicorn forked the worker from does not run in the worker.
+    def _ensure_flusher(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, name='like-flusher', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(app.config['LIKE_FLUSH_INTERVAL_SECONDS']):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush the like buffer')
+
+    # Writes the buffered likes to the database, returns the number of likes
+    # inserted and deleted. The likes stay buffered if the transaction fails.
+    # Called in a request it commits the session of the request.
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch = dict(self._pending)
+            if not batch:
+                return 0
+            with nullcontext() if has_app_context() else app.app_context():
+                try:
+                    written = _write_likes(batch)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+            # Likes toggled again during the flush stay buffered
+            with self._lock:
+                for key, liked in batch.items():
+                    if self._pending.get(key) == liked:
+                        del self._pending[key]
+            return written
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+# Applies the like states of batch, compared to the likes in the database, in
+# the session of the current app context.
+def _write_likes(batch):
+    from app import db_manager
+    wanted = defaultdict(dict)
+    for (user_id, question_id), liked in batch.items():
+        wanted[user_id][question_id] = liked
+    inserts = []
+    deleted_count = 0
+    deltas = defaultdict(int)
+    # A like adds its current weight, an unlike removes the weight its like
+    # added when it was made
+    hot_deltas = defaultdict(float)
+    now = datetime.utcnow()
+    like_weight = db_manager._like_weight(now, trending.trending_epoch.get())
+    for user_id, states in wanted.items():
+        like_weights = db_manager._get_like_weights(user_id, list(states))
+        deleted = []
+        for question_id, liked in states.items():
+            if liked and question_id not in like_weights:
+                inserts.append({"liker_id": user_id, "liked_id": question_id, "timestamp": now})
+                deltas[question_id] += 1
+                hot_deltas[question_id] += like_weight
+            elif not liked and question_id in like_weights:
+                deleted.append(question_id)
+                deltas[question_id] -= 1
+                hot_deltas[question_id] -= like_weights[question_id]
+        deleted_count += len(deleted)
+        for chunk in db_manager._chunks(deleted):
+            db.session.execute(models.question_likes.delete().where(and_(
+                models.question_likes.c.liker_id == user_id, models.question_likes.c.liked_id.in_(chunk))))
+    # Three parameters per row, the chunks stay below the parameter limit
+    for start in range(0, len(inserts), db_manager.IN_CLAUSE_CHUNK_SIZE // 3):
+        db.session.execute(models.question_likes.insert().values(
+            inserts[start:start + db_manager.IN_CLAUSE_CHUNK_SIZE // 3]))
+    # A question liked by one user and unliked by another keeps its count but
+    # not its score
+    questions_by_delta = defaultdict(list)
+    for question_id, delta in deltas.items():
+        if delta or hot_deltas[question_id]:
+            questions_by_delta[delta].append(question_id)
+    for delta, question_ids in questions_by_delta.items():
+        for chunk in db_manager._chunks(question_ids):
+            db_manager._increment_counters_of_questions(
+                chunk, hot_deltas={question_id: hot_deltas[question_id] for question_id in chunk}, like_count=delta)
+    return len(inserts) + deleted_count
+
+like_buffer = LikeBuffer()
+
+# Flushes the buffer of a process that exits, also called by the worker_exit
+# hook of gunicorn.conf.py
+@atexit.register
+def flush_on_exit():
+    if len(like_buffer):
+        try:
+            like_buffer.stop()
+        except Exception:
+            logger.exception('Could not flush the like buffer on exit')
@@ -0,0 +1,73 @@
+import os
+import time
+from flask import g, request
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool, QueuePool
+from app import app
+from app.json_provider import jsonify
+
+# Prometheus metrics for the requests, the JWT revocation check and the
+# database connection pool, exported on /metrics.
+#
+# Gunicorn runs several worker processes, so when PROMETHEUS_MULTIPROC_DIR is
+# set (gunicorn.conf.py does this) every worker writes its values to files in
+# that directory and /metrics adds up the values of all workers.
+
+REQUEST_COUNT = Counter('http_requests_total', 'Number of HTTP requests.',
+                        ['endpoint', 'method', 'status'])
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time spent handling HTTP requests.',
+                            ['endpoint', 'method'])
+REVOCATION_CHECK_LATENCY = Histogram('jwt_revocation_check_seconds', 'Time spent checking whether a JWT is revoked.',
+                                     buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5))
+POOL_CHECKOUTS = Counter('db_pool_checkouts_total', 'Number of database connection checkouts.')
+POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Database connections currently checked out.',
+                         multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('db_pool_overflow', 'Database connections checked out beyond the pool size.',
+                      multiprocess_mode='livesum')
+
+# The checkin event does not get the pool, a QueuePool is kept in the info
+# of the connection record at checkout
+@event.listens_for(Pool, 'checkout')
+def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_CHECKOUTS.inc()
+    POOL_CHECKED_OUT.inc()
+    pool = connection_proxy._pool
+    if isinstance(pool, QueuePool):
+        connection_record.info['metrics_pool'] = pool
+        POOL_OVERFLOW.set(max(0, pool.checkedout() - pool.size()))
+
+# Checkin runs before the connection is returned to the pool, so it is not
+# counted as checked out
+@event.listens_for(Pool, 'checkin')
+def _pool_checkin(dbapi_connection, connection_record):
+    POOL_CHECKED_OUT.dec()
+    pool = connection_record.info.get('metrics_pool')
+    if pool is not None:
+        POOL_OVERFLOW.set(max(0, pool.checkedout() - 1 - pool.size()))
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+# Requests are labelled by their url rule, e.g. /questions/<question_id>, to
+# keep one time series per route.
+@app.after_request
+def _observe_request(response):
+    if 'request_started' in g:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - g.request_started)
+        REQUEST_COUNT.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+@app.route('/metrics')
+def metrics():
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({"msg": "Metrics are disabled"}), 404
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), 200, {'Content-Type': CONTENT_TYPE_LATEST}
@@ -1,19 +1,25 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-from app import db
+from sqlalchemy import DDL, event
+from app import db, passwords
 
 # Association table for followers which represents the followed relation
 # between one user and the other user.
 followers = db.Table('followers',
     db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('followed_id', db.Integer, db.ForeignKey('user.id')),
+    db.Index('ix_followers_follower_id_followed_id', 'follower_id', 'followed_id', unique=True),
+    db.Index('ix_followers_followed_id', 'followed_id')
 )
 
 # Association table for question likes which represents the liked_questions
 # relation between one user and one question.
 question_likes = db.Table('question_likes',
     db.Column('liker_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('liked_id', db.Integer, db.ForeignKey('question.id'))
+    db.Column('liked_id', db.Integer, db.ForeignKey('question.id')),
+    # When the question was liked, an unlike removes the hot score the like
+    # added then. Likes from before the column count as made with the question
+    db.Column('timestamp', db.DateTime, default=datetime.utcnow),
+    db.Index('ix_question_likes_liker_id_liked_id', 'liker_id', 'liked_id', unique=True)
 )
 
 class User(db.Model):
@@ -43,28 +49,52 @@ class User(db.Model):
         lazy='dynamic'
     )
 
+    # Followed user ids cached by followed_ids, not a database column
+    _followed_ids = None
+
     # Methods for handling following relations
 
     def follow(self, user):
         if not self.is_following(user):
             self.followed.append(user)
+            if self._followed_ids is not None:
+                self._followed_ids.add(user.id)
     
     def unfollow(self, user):
         if self.is_following(user):
             self.followed.remove(user)
+            if self._followed_ids is not None:
+                self._followed_ids.discard(user.id)
     
     def is_following(self, user):
+        if self._followed_ids is not None:
+            return user.id in self._followed_ids
         return self.followed.filter(followers.c.followed_id == user.id).count() > 0
+
+    # Loads the ids of all followed users with a single query. The set is kept
+    # on the user for the rest of the request, so is_following can be called
+    # for every user in a list without a query per user.
+    def followed_ids(self):
+        if self._followed_ids is None:
+            self._followed_ids = set(followed_id for (followed_id,) in db.session.query(
+                followers.c.followed_id).filter(followers.c.follower_id == self.id))
+        return self._followed_ids
     
     # Methods for handling question likes
 
+    # Returns whether the like was added, so the like count can be updated
     def like_question(self, question):
         if not self.is_liking_question(question):
             self.liked_questions.append(question)
+            return True
+        return False
     
+    # Returns whether the like was removed, so the like count can be updated
     def unlike_question(self, question):
         if self.is_liking_question(question):
             self.liked_questions.remove(question)
+            return True
+        return False
     
     def is_liking_question(self, question):
         return self.liked_questions.filter(question_likes.c.liked_id == question.id).count() > 0
@@ -74,7 +104,7 @@ class User(db.Model):
     def __init__(self, username, email, password):
         self.username = username
         self.email = email
-        self.password_hash = generate_password_hash(password, salt_length=8)
+        self.set_password(password)
 
     def __repr__(self):
         return '<User {}>'.format(self.username)
@@ -86,12 +116,15 @@ class User(db.Model):
                 "email": self.email
             }
 
+    def set_password(self, password):
+        self.password_hash = passwords.hash_password(password)
+
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.check_password(self.password_hash, password)
 
 class Token(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    jti = db.Column(db.String, nullable=False)
+    jti = db.Column(db.String, index=True, unique=True, nullable=False)
     token_type = db.Column(db.String, nullable=False)
     user_identity = db.Column(db.String, nullable=False)
     expires = db.Column(db.DateTime, nullable=False)
@@ -141,8 +174,23 @@ class Question(db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'))
+    # Stored counts kept up to date by db_manager, so serializing a question
+    # does not have to count its likes and answers
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    answer_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped whenever the likes or answers of the question change, used for ETags
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Trending rank of the question, kept up to date by db_manager, see trending
+    hot_score = db.Column(db.Float, nullable=False, default=0, server_default='0')
     answers = db.relationship('Answer', backref='parent_question', lazy='dynamic')
 
+    __table_args__ = (
+        db.Index('ix_question_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_question_course_id_timestamp', 'course_id', 'timestamp'),
+        db.Index('ix_question_hot_score_id', 'hot_score', 'id'),
+        db.Index('ix_question_course_id_hot_score_id', 'course_id', 'hot_score', 'id'),
+    )
+
     # Relationship between question and users that likes it
     likers = db.relationship(
         'User',
@@ -158,11 +206,15 @@ class Question(db.Model):
     def nr_answers(self):
         return db.session.query(Answer).filter(Answer.question_id == self.id).count()
 
-    def __init__(self, question_title, question_body, author, course_room):
+    def __init__(self, question_title, question_body, author, course_id):
         self.question_title = question_title
         self.question_body = question_body
         self.author = author
-        self.course_room = course_room
+        self.course_id = course_id
+        self.like_count = 0
+        self.answer_count = 0
+        self.version = 1
+        self.hot_score = 0
 
     def __repr__(self):
         return '<Question {}>'.format(self.question_title)
@@ -175,10 +227,43 @@ class Question(db.Model):
                 "timestamp": self.timestamp,
                 "author": self.author.to_dict(),
                 "course": self.course_room.to_dict(),
-                "likes": self.likes(),
-                "answers": self.nr_answers()
+                "likes": self.like_count,
+                "answers": self.answer_count
             }
 
+# Full text search index over the title and body of the questions, kept in
+# sync with the question table by the database. On SQLite it is the FTS5
+# table question_fts that reads its content from the question table, and
+# triggers that update it when questions are inserted, deleted or their text
+# changes. On Postgres it is a GIN index over the weighted tsvector of the
+# question, QUESTION_SEARCH_VECTOR, which queries have to use verbatim.
+QUESTION_FTS_SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS question_fts USING fts5(
+        question_title, question_body, content='question', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_insert AFTER INSERT ON question BEGIN
+        INSERT INTO question_fts(rowid, question_title, question_body)
+            VALUES (new.id, new.question_title, new.question_body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_delete AFTER DELETE ON question BEGIN
+        INSERT INTO question_fts(question_fts, rowid, question_title, question_body)
+            VALUES ('delete', old.id, old.question_title, old.question_body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_update AFTER UPDATE OF question_title, question_body ON question BEGIN
+        INSERT INTO question_fts(question_fts, rowid, question_title, question_body)
+            VALUES ('delete', old.id, old.question_title, old.question_body);
+        INSERT INTO question_fts(rowid, question_title, question_body)
+            VALUES (new.id, new.question_title, new.question_body);
+    END"""
+]
+QUESTION_SEARCH_VECTOR = ("setweight(to_tsvector('english', coalesce(question_title, '')), 'A') || "
+                          "setweight(to_tsvector('english', coalesce(question_body, '')), 'B')")
+
+for statement in QUESTION_FTS_SQLITE:
+    event.listen(Question.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Question.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS question_fts').execute_if(dialect='sqlite'))
+event.listen(Question.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_question_search ON question USING gin ((' + QUESTION_SEARCH_VECTOR + '))').execute_if(dialect='postgresql'))
+
 class Answer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     answer_body = db.Column(db.Text)
@@ -186,6 +271,10 @@ class Answer(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     question_id = db.Column(db.Integer, db.ForeignKey('question.id'))
 
+    __table_args__ = (
+        db.Index('ix_answer_question_id_timestamp', 'question_id', 'timestamp'),
+    )
+
     def __init__(self, answer_body, author, parent_question):
         self.answer_body = answer_body
         self.author = author
@@ -201,3 +290,36 @@ class Answer(db.Model):
                 "timestamp": self.timestamp,
                 "author": self.author.to_dict()
             }
+
+# Materialized home timeline entry, one row per question asked by a user that
+# is followed by the timeline owner. The rows are only maintained when
+# FEED_TIMELINE_ENABLED is set.
+class TimelineEntry(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_timeline_entry_user_id_timestamp', 'user_id', 'timestamp', 'question_id'),
+    )
+
+    def __init__(self, user_id, question_id, timestamp):
+        self.user_id = user_id
+        self.question_id = question_id
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return '<TimelineEntry {} {}>'.format(self.user_id, self.question_id)
+
+# Version number of a named set of data, like the course catalog, bumped
+# whenever the data changes. Used for ETags and to invalidate caches.
+class VersionStamp(db.Model):
+    name = db.Column(db.String, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+
+    def __init__(self, name, version=1):
+        self.name = name
+        self.version = version
+
+    def __repr__(self):
+        return '<VersionStamp {} {}>'.format(self.name, self.version)
@@ -0,0 +1,66 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from app import app, cooperative
+
+# Password hashing is CPU bound, so it is run in a small process pool of
+# PASSWORD_HASH_POOL_SIZE processes instead of in the request worker. The
+# pool bounds how many hashes are computed at once, and cheap requests are
+# not stuck behind them. A pool size of 0 hashes in the calling process.
+#
+# In gevent workers a thread pool is used instead, a process pool does not
+# work with the monkey patched standard library. PBKDF2 releases the GIL, so
+# the other greenlets of the worker keep running while a hash is computed.
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+# The pool is created on first use in each process, since processes forked
+# by gunicorn can not use the pool of their parent.
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            if cooperative.is_gevent_patched():
+                from gevent.threadpool import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_POOL_SIZE'])
+            else:
+                _executor = ProcessPoolExecutor(max_workers=app.config['PASSWORD_HASH_POOL_SIZE'])
+            _executor_pid = os.getpid()
+        return _executor
+
+# Drops the pool if it is still broken_executor, the next call creates a new one
+def _reset_executor(broken_executor):
+    global _executor
+    with _executor_lock:
+        if _executor is broken_executor:
+            _executor = None
+    broken_executor.shutdown(wait=False)
+
+# A pool whose process died, e.g. killed for running out of memory, fails
+# every call, so it is replaced and the call retried once
+def _run(fn, *args):
+    if app.config['PASSWORD_HASH_POOL_SIZE'] <= 0:
+        return fn(*args)
+    executor = _get_executor()
+    try:
+        return executor.submit(fn, *args).result()
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        return _get_executor().submit(fn, *args).result()
+
+def hash_password(password):
+    return _run(generate_password_hash, password,
+                app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_SALT_LENGTH'])
+
+def check_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+# Whether password_hash was made with other parameters than the configured
+# ones. Hashes have the format method$salt$hash.
+def needs_rehash(password_hash):
+    method, salt, _ = password_hash.split('$', 2)
+    return method != app.config['PASSWORD_HASH_METHOD'] or len(salt) != app.config['PASSWORD_HASH_SALT_LENGTH']
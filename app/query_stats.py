@@ -0,0 +1,33 @@
+import time
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+# Counts the SQL statements of each request and the time spent executing them.
+# With SQL_QUERY_STATS_ENABLED the totals are sent in the X-DB-Queries and
+# X-DB-Time-ms response headers, except on streamed responses where most of
+# the queries are made after the headers are sent. The events are registered on the Engine class
+# since the engine of db is recreated when the database uri changes.
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_stats_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and app.config['SQL_QUERY_STATS_ENABLED']:
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + time.perf_counter() - context._query_stats_started
+
+@app.before_request
+def _reset_query_stats():
+    g.db_queries = 0
+    g.db_time = 0.0
+
+@app.after_request
+def _add_query_stats_headers(response):
+    if app.config['SQL_QUERY_STATS_ENABLED'] and not response.is_streamed:
+        response.headers['X-DB-Queries'] = str(g.get('db_queries', 0))
+        response.headers['X-DB-Time-ms'] = '{:.3f}'.format(g.get('db_time', 0.0) * 1000)
+    return response
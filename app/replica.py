@@ -0,0 +1,110 @@
+import math
+import threading
+import time
+from flask import _app_ctx_stack, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, orm
+from app import app, db
+
+# Routing of reads to a read replica of the database, configured as the
+# 'replica' bind in SQLALCHEMY_BINDS. The read only db_manager functions
+# query through reader(), which is a session on the replica during GET
+# requests and db.session otherwise.
+#
+# The replica may lag behind the primary, so a client that just wrote keeps
+# reading from the primary for REPLICA_STICKY_SECONDS. A request that commits
+# sets the db_primary_until cookie on its response and records the time for
+# its user in this process, either one keeps the following requests on the
+# primary. The requests of clients that do not keep cookies are only sticky
+# in the worker that served the write.
+
+STICKY_COOKIE = 'db_primary_until'
+
+# Users with a recent write are pruned from _written_until when it grows
+# beyond this many entries
+STICKY_USERS_PRUNE_SIZE = 10000
+
+_written_until = {}
+_written_lock = threading.Lock()
+
+# Session bound to the replica. Tables are not bound to their engine like in
+# db.session, which would route them back to the primary.
+class ReplicaSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        options['bind'] = db.get_engine(db.get_app(), bind='replica')
+        options['binds'] = {}
+        SignallingSession.__init__(self, db, **options)
+
+read_session = orm.scoped_session(orm.sessionmaker(class_=ReplicaSession, db=db, autoflush=False),
+                                  scopefunc=_app_ctx_stack.__ident_func__)
+
+@app.teardown_appcontext
+def _remove_read_session(exception=None):
+    read_session.remove()
+
+def is_configured():
+    return 'replica' in (app.config['SQLALCHEMY_BINDS'] or {})
+
+# Whether the reads of the current request may be served by the replica
+def use_replica():
+    if not is_configured() or not has_request_context():
+        return False
+    if request.method not in ('GET', 'HEAD') or g.get('db_written'):
+        return False
+    now = time.time()
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > now:
+            return False
+    except ValueError:
+        pass
+    current_user = g.get('current_user')
+    return current_user is None or _written_until.get(current_user.id, 0) <= now
+
+# The session the read only functions query through
+def reader():
+    return read_session if use_replica() else db.session
+
+@event.listens_for(db.session, 'after_commit')
+def _mark_written(session):
+    if has_request_context():
+        g.db_written = True
+
+# Copies the primary database into the replica when both are SQLite files,
+# to try the routing locally without setting up replication. The replica
+# lags until the next copy.
+def sync_sqlite_replica():
+    primary_engine = db.get_engine(app)
+    replica_engine = db.get_engine(app, bind='replica')
+    if primary_engine.dialect.name != 'sqlite' or replica_engine.dialect.name != 'sqlite':
+        raise ValueError('The primary and the replica must both be SQLite databases')
+    primary = primary_engine.raw_connection()
+    try:
+        target = replica_engine.raw_connection()
+        try:
+            primary.connection.backup(target.connection)
+        finally:
+            target.close()
+    finally:
+        primary.close()
+
+def clear_sticky_users():
+    with _written_lock:
+        _written_until.clear()
+
+@app.after_request
+def _set_primary_sticky(response):
+    if not g.get('db_written') or not is_configured():
+        return response
+    window = app.config['REPLICA_STICKY_SECONDS']
+    until = time.time() + window
+    response.set_cookie(STICKY_COOKIE, '{:.3f}'.format(until), max_age=math.ceil(window), httponly=True)
+    current_user = g.get('current_user')
+    if current_user is not None:
+        with _written_lock:
+            if len(_written_until) >= STICKY_USERS_PRUNE_SIZE:
+                now = time.time()
+                for user_id in [user_id for user_id, written in _written_until.items() if written <= now]:
+                    del _written_until[user_id]
+            _written_until[current_user.id] = until
+    return response
@@ -1,6 +1,42 @@
-from flask import request, jsonify
-from app import app, db_manager, jwt
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import request
+from app import app, db_manager, jwt, metrics, streaming
+from app.auth import get_current_user, create_user_access_token
+from app.json_provider import jsonify
+from flask_jwt_extended import jwt_required
+
+# - - - Conditional requests - - -
+
+# Returns an empty 304 response if the client already has the version of the
+# resource identified by etag, None otherwise.
+def _not_modified(etag):
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+# Sends data as JSON with the provided etag
+def _jsonify_with_etag(data, etag):
+    response = jsonify(data)
+    response.set_etag(etag)
+    return response
+
+# The liked state in a question depends on the requesting user, which is
+# part of the etag. Likes by the user bump the question version once they
+# are written, while they are buffered their state is part of the etag.
+def _question_etag(question_id, version, user):
+    etag = "question-{}-{}-{}".format(question_id, version, user.id)
+    buffered_like = db_manager.get_buffered_like(user, question_id)
+    if buffered_like is not None:
+        etag += "-liked" if buffered_like else "-unliked"
+    return etag
+
+def _answers_etag(question_id, version):
+    return "answers-{}-{}".format(question_id, version)
+
+def _courses_etag(version):
+    return "courses-{}".format(version)
+
 
 # - - - Index Route - - -
 
@@ -15,7 +51,8 @@ def index():
 # Helper required for JWT functionality
 @jwt.token_in_blacklist_loader
 def check_if_token_revoked(decoded_token):
-    return db_manager.is_token_revoked(decoded_token)
+    with metrics.REVOCATION_CHECK_LATENCY.time():
+        return db_manager.is_token_revoked(decoded_token)
 
 
 # Returns an access token for a successful login using the provided email and
@@ -29,7 +66,8 @@ def login():
         return jsonify({"msg": "Wrong email"}), 409
     if not user.check_password(password):
         return jsonify({"msg": "Wrong password"}), 409
-    access_token = create_access_token(identity=email)
+    db_manager.upgrade_password_hash(user, password)
+    access_token = create_user_access_token(user)
     return jsonify({
         "access_token": access_token,
         "token_type": "Bearer",
@@ -55,8 +93,7 @@ def refresh_token():
     auth_header = request.headers.get('Authorization')
     revoked_token = auth_header.split(" ")[1]
     db_manager.add_token_to_blacklist(revoked_token, app.config['JWT_IDENTITY_CLAIM'])
-    email = get_jwt_identity()
-    access_token = create_access_token(identity=email)
+    access_token = create_user_access_token(get_current_user())
     return jsonify({
         "access_token": access_token,
         "token_type": "Bearer",
@@ -66,19 +103,35 @@ def refresh_token():
 
 # - - - User routes (registering, fetching etc.) - - -
 
+# Converts user to a dict with whether it is followed by current_user.
+def _user_dict(user, current_user):
+    user_dict = user.to_dict()
+    user_dict["is_followed"] = "{}".format(current_user.is_following(user))
+    return user_dict
+
+
 # Fetches all users except the one making the request and also whether they
 # are followed or not by the requesting user.
 @app.route('/users')
 @jwt_required
 def all_users():
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
-    users = []
-    for user in db_manager.get_all_users(current_user):
-        user_dict = user.to_dict()
-        user_dict["is_followed"] = "{}".format(current_user.is_following(user))
-        users.append(user_dict)
-    return jsonify({"users": users})
+    current_user = get_current_user()
+    current_user.followed_ids()
+    users = db_manager.get_all_users(current_user, streaming.is_enabled())
+    return streaming.jsonify_list("users", (_user_dict(user, current_user) for user in users))
+
+
+# Suggests users for the requesting user to follow, ranked by how many of the
+# users it follows follow them and how many courses both asked questions in.
+@app.route('/suggested_users')
+@jwt_required
+def suggested_users():
+    current_user = get_current_user()
+    limit = request.args.get('limit', app.config['SUGGESTIONS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['SUGGESTIONS_MAX_LIMIT']))
+    suggestions = db_manager.get_follow_suggestions(current_user, limit)
+    return jsonify({"users": [dict(user.to_dict(), mutual_follows=mutual, shared_courses=shared)
+                              for user, mutual, shared in suggestions]})
 
 
 # Registers a new user to the application, the username and email address
@@ -102,22 +155,18 @@ def register():
 @app.route('/users/<username>')
 @jwt_required
 def user_by_username(username):
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
     fetched_user = db_manager.get_user_by_username(username)
     if fetched_user is None:
         return jsonify({"msg": "User does not exist"}), 303
-    fetched_user_dict = fetched_user.to_dict()
-    fetched_user_dict["is_followed"] = "{}".format(current_user.is_following(fetched_user))
-    return jsonify(fetched_user_dict)
+    return jsonify(_user_dict(fetched_user, current_user))
 
 
 # Fetches user details based on the current user.
 @app.route('/users/current')
 @jwt_required
 def current_user():
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
     current_user_dict = current_user.to_dict()
     return jsonify(current_user_dict)
 
@@ -128,21 +177,16 @@ def current_user():
 @app.route('/followed_users')
 @jwt_required
 def followed_users():
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
-    followed_users = []
-    for followed_user in db_manager.get_all_followed_users(current_user):
-        user_dict = followed_user.to_dict()
-        followed_users.append(user_dict)
-    return jsonify({"users": followed_users})
+    current_user = get_current_user()
+    followed_users = db_manager.get_all_followed_users(current_user, streaming.is_enabled())
+    return streaming.jsonify_list("users", (followed_user.to_dict() for followed_user in followed_users))
 
 
 # The requesting user follows the user with the provided username.
 @app.route('/followed_users/<username>', methods=['POST'])
 @jwt_required
 def follow(username):
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
     user_to_follow = db_manager.get_user_by_username(username)
     if user_to_follow is None:
         return jsonify({"msg": "User does not exist"}), 303
@@ -154,8 +198,7 @@ def follow(username):
 @app.route('/followed_users/<username>', methods=['DELETE'])
 @jwt_required
 def unfollow(username):
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
     user_to_unfollow = db_manager.get_user_by_username(username)
     if user_to_unfollow is None:
         return jsonify({"msg": "User does not exist"}), 303
@@ -163,20 +206,65 @@ def unfollow(username):
     return jsonify({"msg": "Unfollow successful"}), 200
 
 
+# Reads the list in the field name of the JSON body of a batch request.
+# Returns the list, or None if it is missing, not a list or too long.
+def _get_batch_items(name):
+    items = (request.get_json(silent=True) or {}).get(name, None)
+    if not isinstance(items, list) or len(items) > app.config['BATCH_MAX_ITEMS']:
+        return None
+    return items
+
+
+# The requesting user follows all the users in the provided JSON list of
+# usernames, the status of each username is returned in the same order.
+@app.route('/followed_users', methods=['POST'])
+@jwt_required
+def follow_batch():
+    current_user = get_current_user()
+    usernames = _get_batch_items('usernames')
+    if usernames is None or not all(isinstance(username, str) for username in usernames):
+        return jsonify({"msg": "Provide a list of at most {} usernames".format(app.config['BATCH_MAX_ITEMS'])}), 400
+    results = db_manager.follow_users(current_user, usernames)
+    return jsonify({"results": [{"username": username, "status": status} for username, status in results]}), 200
+
+
+# The requesting user unfollows all the users in the provided JSON list of
+# usernames, the status of each username is returned in the same order.
+@app.route('/followed_users', methods=['DELETE'])
+@jwt_required
+def unfollow_batch():
+    current_user = get_current_user()
+    usernames = _get_batch_items('usernames')
+    if usernames is None or not all(isinstance(username, str) for username in usernames):
+        return jsonify({"msg": "Provide a list of at most {} usernames".format(app.config['BATCH_MAX_ITEMS'])}), 400
+    results = db_manager.unfollow_users(current_user, usernames)
+    return jsonify({"results": [{"username": username, "status": status} for username, status in results]}), 200
+
+
 # - - - Question routes (ask question, fetch question, like question etc.) - - -
 
+# Reads the optional limit and before (cursor) query parameters of the
+# paginated question lists. Without a limit the whole list is returned.
+def _get_page_args():
+    limit = request.args.get('limit', None, type=int)
+    if limit is not None:
+        limit = max(1, min(limit, app.config['QUESTIONS_PAGE_MAX_LIMIT']))
+    return limit, request.args.get('before', None)
+
+
 # Fetches the questions asked by users followed by the requesting user.
 @app.route('/questions')
 @jwt_required
 def all_questions():
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
-    questions = []
-    for question in db_manager.get_followed_questions(current_user):
-        question_dict = question.to_dict()
-        question_dict["is_liking"] = "{}".format(current_user.is_liking_question(question))
-        questions.append(question_dict)
-    return jsonify({"questions": questions})
+    current_user = get_current_user()
+    limit, cursor = _get_page_args()
+    try:
+        questions, next_cursor = db_manager.get_followed_questions(current_user, limit, cursor, streaming.is_enabled())
+    except ValueError:
+        return jsonify({"msg": "Invalid cursor"}), 400
+    if limit is None:
+        return streaming.jsonify_list("questions", db_manager.iter_question_dicts(questions, current_user))
+    return jsonify({"questions": db_manager.get_question_dicts(questions, current_user), "next_cursor": next_cursor})
 
 
 # Posts a question using the provided JSON data.
@@ -186,14 +274,13 @@ def ask_question():
     question_title = request.json.get('question_title', None)
     question_body = request.json.get('question_body', None)
     course_room = request.json.get('course_room', None)
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
     current_course = db_manager.get_course_by_code(course_room)
 
     if not current_course:
         return jsonify({"msg": "This course does not exist"}), 404
     
-    db_manager.add_question(question_title, question_body, current_user, current_course)
+    db_manager.add_question(question_title, question_body, current_user.user, current_course)
     return jsonify({"msg": "Question successfully added"}), 200
 
 
@@ -201,22 +288,26 @@ def ask_question():
 @app.route('/questions/<question_id>')
 @jwt_required
 def get_question(question_id):
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
+    if request.if_none_match:
+        version = db_manager.get_question_version(question_id)
+        if version is not None:
+            not_modified = _not_modified(_question_etag(question_id, version, current_user))
+            if not_modified:
+                return not_modified
     current_question = db_manager.get_question_by_id(question_id)
     if current_question is None:
         return jsonify({"msg": "Question does not exist"}), 303
-    current_question_dict = current_question.to_dict()
-    current_question_dict["is_liking"] = "{}".format(current_user.is_liking_question(current_question))
-    return jsonify(current_question_dict)
+    current_question_dict = db_manager.get_question_dicts([current_question], current_user)[0]
+    return _jsonify_with_etag(current_question_dict,
+                _question_etag(question_id, current_question.version, current_user))
 
 
 # The requesting user likes the question with the provided question_id.
 @app.route('/liked_questions/<question_id>', methods=['POST'])
 @jwt_required
 def like_question(question_id):
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
     question_to_like = db_manager.get_question_by_id(question_id)
     if question_to_like is None:
         return jsonify({"msg": "Question does not exist"}), 303
@@ -228,8 +319,7 @@ def like_question(question_id):
 @app.route('/liked_questions/<question_id>', methods=['DELETE'])
 @jwt_required
 def unlike_question(question_id):
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
     question_to_unlike = db_manager.get_question_by_id(question_id)
     if question_to_unlike is None:
         return jsonify({"msg": "Question does not exist"}), 303
@@ -237,18 +327,88 @@ def unlike_question(question_id):
     return jsonify({"msg": "Unlike successful"}), 200
 
 
+# The requesting user likes all the questions in the provided JSON list of
+# question ids, the status of each question id is returned in the same order.
+@app.route('/liked_questions', methods=['POST'])
+@jwt_required
+def like_batch():
+    current_user = get_current_user()
+    question_ids = _get_batch_items('question_ids')
+    if question_ids is None:
+        return jsonify({"msg": "Provide a list of at most {} question ids".format(app.config['BATCH_MAX_ITEMS'])}), 400
+    results = db_manager.like_questions(current_user, question_ids)
+    return jsonify({"results": [{"question_id": question_id, "status": status} for question_id, status in results]}), 200
+
+
+# The requesting user unlikes all the questions in the provided JSON list of
+# question ids, the status of each question id is returned in the same order.
+@app.route('/liked_questions', methods=['DELETE'])
+@jwt_required
+def unlike_batch():
+    current_user = get_current_user()
+    question_ids = _get_batch_items('question_ids')
+    if question_ids is None:
+        return jsonify({"msg": "Provide a list of at most {} question ids".format(app.config['BATCH_MAX_ITEMS'])}), 400
+    results = db_manager.unlike_questions(current_user, question_ids)
+    return jsonify({"results": [{"question_id": question_id, "status": status} for question_id, status in results]}), 200
+
+
 # Fetches the questions asked by users followed by the requesting user.
 @app.route('/myquestions')
 @jwt_required
 def my_questions():
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
-    questions = []
-    for question in db_manager.get_questions_by_user(current_user):
-        question_dict = question.to_dict()
-        question_dict["is_liking"] = "{}".format(current_user.is_liking_question(question))
-        questions.append(question_dict)
-    return jsonify({"questions": questions})
+    current_user = get_current_user()
+    limit, cursor = _get_page_args()
+    try:
+        questions, next_cursor = db_manager.get_questions_by_user(current_user, limit, cursor, streaming.is_enabled())
+    except ValueError:
+        return jsonify({"msg": "Invalid cursor"}), 400
+    if limit is None:
+        return streaming.jsonify_list("questions", db_manager.iter_question_dicts(questions, current_user))
+    return jsonify({"questions": db_manager.get_question_dicts(questions, current_user), "next_cursor": next_cursor})
+
+
+# Searches the questions for the words in the query parameter q, best match
+# first. The results are paginated with limit and offset, and can be limited
+# to one course room with course.
+@app.route('/search')
+@jwt_required
+def search():
+    current_user = get_current_user()
+    terms = db_manager.get_search_terms(request.args.get('q', None))
+    if not terms:
+        return jsonify({"msg": "Missing search query"}), 400
+    limit = request.args.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['QUESTIONS_PAGE_MAX_LIMIT']))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    course = None
+    course_code = request.args.get('course', None)
+    if course_code is not None:
+        course = db_manager.get_course_by_code(course_code)
+        if course is None:
+            return jsonify({"msg": "This course does not exist"}), 404
+    questions, next_offset = db_manager.search_questions(terms, course, limit, offset)
+    return jsonify({"questions": db_manager.get_question_dicts(questions, current_user), "next_offset": next_offset})
+
+
+# The trending questions, the most liked and answered recently first. The
+# results are paginated with limit and offset, and can be limited to one
+# course room with course.
+@app.route('/questions/trending')
+@jwt_required
+def trending_questions():
+    current_user = get_current_user()
+    limit = request.args.get('limit', app.config['TRENDING_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['QUESTIONS_PAGE_MAX_LIMIT']))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    course = None
+    course_code = request.args.get('course', None)
+    if course_code is not None:
+        course = db_manager.get_course_by_code(course_code)
+        if course is None:
+            return jsonify({"msg": "This course does not exist"}), 404
+    questions, next_offset = db_manager.get_trending_questions(course, limit, offset)
+    return jsonify({"questions": db_manager.get_question_dicts(questions, current_user), "next_offset": next_offset})
 
 
 # - - - Answer routes (answer question, like answer etc.) - - -
@@ -257,13 +417,12 @@ def my_questions():
 @app.route('/answer_question/<question_id>', methods=['POST'])
 @jwt_required
 def answer_question(question_id):
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    current_user = get_current_user()
     current_question = db_manager.get_question_by_id(question_id)
     if current_question is None:
         return jsonify({"msg": "Question does not exist"}), 303
     answer_body = request.json.get('answer_body', None)
-    db_manager.add_answer(answer_body, current_user, current_question)
+    db_manager.add_answer(answer_body, current_user.user, current_question)
     return jsonify({"msg": "Question successfully answered"}), 200
 
 
@@ -271,35 +430,51 @@ def answer_question(question_id):
 @app.route('/answers/<question_id>')
 @jwt_required
 def get_question_answers(question_id):
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
+    if request.if_none_match:
+        version = db_manager.get_question_version(question_id)
+        if version is not None:
+            not_modified = _not_modified(_answers_etag(question_id, version))
+            if not_modified:
+                return not_modified
     current_question = db_manager.get_question_by_id(question_id)
     if current_question is None:
         return jsonify({"msg": "Question does not exist"}), 303
-    question_answers = []
-    for answer in db_manager.get_question_answers(current_question):
-        question_answers.append(answer.to_dict())
-    return jsonify({"answers": question_answers})
+    answers = db_manager.get_question_answers(current_question, streaming.is_enabled())
+    response = streaming.jsonify_list("answers", (answer.to_dict() for answer in answers))
+    response.set_etag(_answers_etag(question_id, current_question.version))
+    return response
 
 
 # - - - Courses routes (fetch available courses etc.) - - -
 
+# Fetches the questions asked in the course room with the provided
+# course_code, newest first. Paginated like /questions.
+@app.route('/courses/<course_code>/questions')
+@jwt_required
+def course_questions(course_code):
+    current_user = get_current_user()
+    course = db_manager.get_course_by_code(course_code)
+    if course is None:
+        return jsonify({"msg": "This course does not exist"}), 404
+    limit, cursor = _get_page_args()
+    try:
+        questions, next_cursor = db_manager.get_questions_by_course(course, limit, cursor, streaming.is_enabled())
+    except ValueError:
+        return jsonify({"msg": "Invalid cursor"}), 400
+    if limit is None:
+        return streaming.jsonify_list("questions", db_manager.iter_question_dicts(questions, current_user))
+    return jsonify({"questions": db_manager.get_question_dicts(questions, current_user), "next_cursor": next_cursor})
+
+
 # Fetch all available courses.
 @app.route('/courses')
 @jwt_required
 def get_available_courses():
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
-    courses = []
-    for course in db_manager.get_all_courses():
-        courses.append(course.to_dict())
-    return jsonify({"courses": courses})
-
-    email = get_jwt_identity()
-    current_user = db_manager.get_user_by_email(email)
-    questions = []
-    for question in db_manager.get_followed_questions(current_user):
-        question_dict = question.to_dict()
-        question_dict["is_liking"] = "{}".format(current_user.is_liking_question(question))
-        questions.append(question_dict)
-    return jsonify({"questions": questions})
\ No newline at end of file
+    version, body = db_manager.get_courses_body()
+    etag = _courses_etag(version)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    response = app.response_class(body, mimetype=app.config['JSONIFY_MIMETYPE'])
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,27 @@
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+from app import app
+
+# Pragmas of SQLITE_PRODUCTION_MODE, set on every new SQLite connection.
+#
+# journal_mode=WAL lets the readers read while a writer commits, and is
+# stored in the database file. synchronous=NORMAL only syncs the WAL at
+# checkpoints, a power loss can lose the last commits but not corrupt the
+# database. busy_timeout makes a writer wait for the write lock, mmap_size
+# reads the database through memory mapping and cache_size sets the page
+# cache of each connection, negative values are in KiB. The listener is on
+# the Pool class since the engine of db is recreated when the database uri
+# changes.
+
+@event.listens_for(Pool, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection) or not app.config['SQLITE_PRODUCTION_MODE']:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout={:d}'.format(app.config['SQLITE_BUSY_TIMEOUT_MS']))
+    cursor.execute('PRAGMA mmap_size={:d}'.format(app.config['SQLITE_MMAP_SIZE']))
+    cursor.execute('PRAGMA cache_size=-{:d}'.format(app.config['SQLITE_CACHE_SIZE_KB']))
+    cursor.close()
@@ -0,0 +1,47 @@
+from flask import stream_with_context
+from app import app, json_provider
+
+# Streaming of the large list responses. With STREAMING_RESPONSES_ENABLED
+# the routes read their rows with yield_per and the JSON is encoded and sent
+# one item at a time, so the memory used by a request does not grow with the
+# length of the list. The body is identical to the one json_provider.jsonify
+# creates.
+#
+# Streamed responses have no Content-Length, and the X-DB-Queries headers are
+# left out since most of the queries are made after the headers are sent.
+
+# Streaming is only used when jsonify would print the JSON compactly, the
+# indented output is for debugging and is not worth reproducing.
+def is_enabled():
+    return app.config['STREAMING_RESPONSES_ENABLED'] and not (
+                app.config['JSONIFY_PRETTYPRINT_REGULAR'] or app.debug)
+
+# Returns a response with the JSON object {name: items}, where items is an
+# iterable of dicts. The items are consumed while the response is sent when
+# streaming is enabled.
+def jsonify_list(name, items):
+    if not is_enabled():
+        return json_provider.jsonify({name: list(items)})
+    return app.response_class(stream_with_context(_generate_list(name, items)),
+                              mimetype=app.config['JSONIFY_MIMETYPE'])
+
+# Encodes the items one at a time and yields the encoded JSON in chunks of
+# about STREAMING_CHUNK_SIZE characters, so the server does not write to the
+# socket once per item.
+def _generate_list(name, items):
+    chunk_size = app.config['STREAMING_CHUNK_SIZE']
+    encode = json_provider.get_provider().make_encoder()
+    parts = ['{' + encode(name) + ':[']
+    size = 0
+    separator = ''
+    for item in items:
+        part = separator + encode(item)
+        parts.append(part)
+        size += len(part)
+        separator = ','
+        if size >= chunk_size:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    parts.append(']}\n')
+    yield ''.join(parts)
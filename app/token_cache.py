@@ -0,0 +1,68 @@
+import threading
+import time
+from datetime import datetime
+from app import app, db, models
+
+# Process local cache of the jtis of revoked tokens, so checking whether a
+# token is revoked does not query the token table on every request.
+#
+# The cache is warmed from the token table when a gunicorn worker starts, or
+# by the first check, and reloaded every JWT_REVOCATION_CACHE_REFRESH_SECONDS,
+# which is how tokens revoked by other worker processes are picked up. Tokens
+# revoked by this process are added directly by add_token_to_blacklist.
+class RevokedTokenCache(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held while the token table is read, so only one request reloads it
+        self._refresh_lock = threading.Lock()
+        self._revoked = {}
+        self._local = {}
+        self._refreshed_at = None
+
+    def is_revoked(self, jti):
+        refreshed_at = self._refreshed_at
+        if refreshed_at is None:
+            # Nothing is loaded yet, every check waits for the first load
+            with self._refresh_lock:
+                if self._refreshed_at is None:
+                    self._refresh()
+        elif time.monotonic() - refreshed_at >= app.config['JWT_REVOCATION_CACHE_REFRESH_SECONDS']:
+            # Other requests keep checking the old jtis while one reloads them
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    self._refresh()
+                finally:
+                    self._refresh_lock.release()
+        return jti in self._revoked
+
+    def add(self, jti, expires):
+        with self._lock:
+            self._revoked[jti] = expires
+            self._local[jti] = expires
+
+    def refresh(self):
+        with self._refresh_lock:
+            self._refresh()
+
+    # Replaces the cached jtis with the unexpired tokens in the token table.
+    # Tokens added by this process while the table was read are kept.
+    def _refresh(self):
+        now = datetime.now()
+        revoked = dict(db.session.query(models.Token.jti, models.Token.expires).filter(models.Token.expires > now))
+        with self._lock:
+            for jti, expires in list(self._local.items()):
+                if jti in revoked or expires <= now:
+                    del self._local[jti]
+                else:
+                    revoked[jti] = expires
+            self._revoked = revoked
+            self._refreshed_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._revoked = {}
+            self._local = {}
+            self._refreshed_at = None
+
+revoked_tokens = RevokedTokenCache()
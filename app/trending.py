@@ -0,0 +1,59 @@
+import threading
+import time
+from app import app, db, models
+
+# Hot score of the trending questions. Asking a question, each like and each
+# answer add their weight to the score of the question, and the weight of an
+# event halves every TRENDING_HALF_LIFE_SECONDS after it happened.
+#
+# Instead of decaying every score as time passes, an event at time t adds
+# weight * 2^((t - epoch) / half life), so newer events count more and the
+# stored scores keep their order without being updated. This grows without
+# bound, 'flask rescore-trending' moves the epoch to the current time and
+# scales all scores down by the same factor, which should run about once an
+# hour. The epoch is stored in whole minutes as the 'trending_epoch' version
+# stamp.
+
+EPOCH_STAMP = 'trending_epoch'
+
+def epoch_minutes(seconds):
+    return int(seconds // 60)
+
+# Weight of an event at time seconds relative to the epoch
+def decay_factor(seconds, epoch):
+    return 2.0 ** ((seconds - epoch * 60) / app.config['TRENDING_HALF_LIFE_SECONDS'])
+
+# Process local cache of the epoch, reloaded at most every
+# TRENDING_EPOCH_REFRESH_SECONDS. A score updated with an outdated epoch
+# right after a rescoring is off by the decay of that interval.
+class TrendingEpoch(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epoch = None
+        self._checked_at = None
+
+    def get(self):
+        epoch = self._epoch
+        if self._checked_at is None or time.monotonic() - self._checked_at >= app.config['TRENDING_EPOCH_REFRESH_SECONDS']:
+            with self._lock:
+                stored = db.session.query(models.VersionStamp.version).filter_by(name=EPOCH_STAMP).scalar()
+                # A database without the stamp has no scores to be consistent
+                # with, the first epoch is kept until it is created
+                if stored is not None:
+                    epoch = stored
+                elif self._epoch is None:
+                    epoch = epoch_minutes(time.time())
+                self._epoch = epoch
+                self._checked_at = time.monotonic()
+        return epoch
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = None
+
+trending_epoch = TrendingEpoch()
+
+# The score an event with the provided weight adds at the current time
+def current_weight(weight):
+    return weight * decay_factor(time.time(), trending_epoch.get())
@@ -0,0 +1 @@
+# Load benchmarks for the REST API, see benchmarks/driver.py for how to run them.
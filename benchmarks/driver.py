@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app, db, models
+from app.auth import create_user_access_token
+from benchmarks import generator
+
+# Load benchmark driver. For each dataset size a synthetic social graph is
+# generated and every route of the API is called a number of times, reporting
+# the latency percentiles, throughput and SQL statements per request.
+#
+# Run against the Flask test client with a temporary SQLite database:
+#
+#   $ python -m benchmarks.driver --sizes 100 1000 --output results.json
+#
+# Or against a running server. The data is then generated into the database
+# the application is configured with (DATABASE_URL), which must be the one
+# the server uses, and everything in it is replaced:
+#
+#   $ python -m benchmarks.driver --url http://127.0.0.1:8000 --reset-database
+
+# Number of distinct users that make the requests
+CALLERS = 20
+
+# Number of usernames or question ids in each request to the batch routes
+BATCH_SIZE = 10
+
+# Calls the routes through the Flask test client. The SQL statements of a
+# request are counted with an engine event, since the test client runs the
+# request in this process.
+class TestClientTarget(object):
+
+    def __init__(self):
+        self.client = app.test_client()
+        self.statements = 0
+        event.listen(Engine, 'before_cursor_execute', self._count_statement)
+
+    def _count_statement(self, *args):
+        self.statements += 1
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Authorization": "Bearer " + token} if token else {}
+        before = self.statements
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, self.statements - before
+
+    def close(self):
+        event.remove(Engine, 'before_cursor_execute', self._count_statement)
+
+# Calls the routes of a running server over HTTP. The statements per request
+# are read from the X-DB-Queries header when the server sends it.
+class HttpTarget(object):
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = "Bearer " + token
+        data = json.dumps(body).encode() if body is not None else None
+        http_request = urlrequest.Request(self.url + path, data=data, headers=headers, method=method)
+        try:
+            with urlrequest.urlopen(http_request) as response:
+                response.read()
+                status, queries = response.status, response.headers.get('X-DB-Queries')
+        except HTTPError as e:
+            status, queries = e.code, e.headers.get('X-DB-Queries')
+        return status, int(queries) if queries is not None else None
+
+    def close(self):
+        pass
+
+# The users, questions and tokens the routes are called with
+class Workload(object):
+
+    def __init__(self, size, dataset):
+        self.size = size
+        self.dataset = dataset
+        users = db.session.query(models.User).order_by(models.User.id).limit(CALLERS).all()
+        self.callers = users
+        self.tokens = [create_user_access_token(user) for user in users]
+        self.question_ids = [question_id for (question_id,) in db.session.query(models.Question.id).order_by(
+                                models.Question.id.desc()).limit(CALLERS * 10)]
+        self.course_codes = [code for (code,) in db.session.query(models.Course.course_code)]
+
+    def caller(self, i):
+        return self.callers[i % len(self.callers)]
+
+    def token(self, i):
+        return self.tokens[i % len(self.tokens)]
+
+    # A token that is only used once, for the routes that revoke it
+    def fresh_token(self, i):
+        return create_user_access_token(self.caller(i))
+
+    # A user that caller i does not follow before the follow benchmark
+    def other_username(self, i):
+        return generator.bench_username(self.size - (i % (self.size - CALLERS)))
+
+    # BATCH_SIZE users that caller i does not follow before the batch follow benchmark
+    def other_usernames(self, i):
+        return [self.other_username(i + j * CALLERS) for j in range(BATCH_SIZE)]
+
+    def question_id(self, i):
+        return self.question_ids[i % len(self.question_ids)]
+
+    def question_id_batch(self, i):
+        return [self.question_id(i + j * CALLERS) for j in range(BATCH_SIZE)]
+
+    def new_username(self, i):
+        return "new{}_{}".format(self.size, i)
+
+# Each route is called with (method, path, body, token) from its function.
+# Following and liking routes come before their undo routes so that both
+# change data.
+ROUTES = [
+    ("GET /", lambda w, i: ("GET", "/", None, None)),
+    ("POST /users", lambda w, i: ("POST", "/users", {"username": w.new_username(i), "email": w.new_username(i) + "@bench.test",
+                                                     "password": generator.BENCH_PASSWORD}, None)),
+    ("POST /login", lambda w, i: ("POST", "/login", {"email": w.caller(i).email, "password": generator.BENCH_PASSWORD}, None)),
+    ("POST /refresh_token", lambda w, i: ("POST", "/refresh_token", None, w.fresh_token(i))),
+    ("POST /logout", lambda w, i: ("POST", "/logout", None, w.fresh_token(i))),
+    ("GET /users", lambda w, i: ("GET", "/users", None, w.token(i))),
+    ("GET /suggested_users", lambda w, i: ("GET", "/suggested_users", None, w.token(i))),
+    ("GET /users/<username>", lambda w, i: ("GET", "/users/" + w.other_username(i), None, w.token(i))),
+    ("GET /users/current", lambda w, i: ("GET", "/users/current", None, w.token(i))),
+    ("GET /followed_users", lambda w, i: ("GET", "/followed_users", None, w.token(i))),
+    ("POST /followed_users/<username>", lambda w, i: ("POST", "/followed_users/" + w.other_username(i), None, w.token(i))),
+    ("DELETE /followed_users/<username>", lambda w, i: ("DELETE", "/followed_users/" + w.other_username(i), None, w.token(i))),
+    ("POST /followed_users", lambda w, i: ("POST", "/followed_users", {"usernames": w.other_usernames(i)}, w.token(i))),
+    ("DELETE /followed_users", lambda w, i: ("DELETE", "/followed_users", {"usernames": w.other_usernames(i)}, w.token(i))),
+    ("GET /questions", lambda w, i: ("GET", "/questions", None, w.token(i))),
+    ("GET /questions?limit=20", lambda w, i: ("GET", "/questions?limit=20", None, w.token(i))),
+    ("POST /questions", lambda w, i: ("POST", "/questions", {"question_title": "Benchmark question {}".format(i),
+                                                             "question_body": "Asked by the benchmark",
+                                                             "course_room": w.course_codes[i % len(w.course_codes)]}, w.token(i))),
+    ("GET /questions/<question_id>", lambda w, i: ("GET", "/questions/{}".format(w.question_id(i)), None, w.token(i))),
+    ("POST /liked_questions/<question_id>", lambda w, i: ("POST", "/liked_questions/{}".format(w.question_id(i)), None, w.token(i))),
+    ("DELETE /liked_questions/<question_id>", lambda w, i: ("DELETE", "/liked_questions/{}".format(w.question_id(i)), None, w.token(i))),
+    ("POST /liked_questions", lambda w, i: ("POST", "/liked_questions", {"question_ids": w.question_id_batch(i)}, w.token(i))),
+    ("DELETE /liked_questions", lambda w, i: ("DELETE", "/liked_questions", {"question_ids": w.question_id_batch(i)}, w.token(i))),
+    ("GET /myquestions", lambda w, i: ("GET", "/myquestions", None, w.token(i))),
+    ("GET /search", lambda w, i: ("GET", "/search?q=" + generator.TOPICS[i % len(generator.TOPICS)], None, w.token(i))),
+    ("GET /questions/trending", lambda w, i: ("GET", "/questions/trending", None, w.token(i))),
+    ("GET /questions/trending?course=<course_code>", lambda w, i: ("GET", "/questions/trending?course=" +
+                                                                  w.course_codes[i % len(w.course_codes)], None, w.token(i))),
+    ("POST /answer_question/<question_id>", lambda w, i: ("POST", "/answer_question/{}".format(w.question_id(i)),
+                                                          {"answer_body": "Benchmark answer"}, w.token(i))),
+    ("GET /answers/<question_id>", lambda w, i: ("GET", "/answers/{}".format(w.question_id(i)), None, w.token(i))),
+    ("GET /courses", lambda w, i: ("GET", "/courses", None, w.token(i))),
+    ("GET /courses/<course_code>/questions?limit=20", lambda w, i: ("GET", "/courses/{}/questions?limit=20".format(
+                                                                   w.course_codes[i % len(w.course_codes)]), None, w.token(i))),
+]
+
+# Nearest rank percentile of sorted values
+def _percentile(sorted_values, percent):
+    index = max(0, int(round(percent / 100.0 * len(sorted_values) + 0.5)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def _summarize(latencies, queries, errors):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    counted = [q for q in queries if q is not None]
+    return {
+            "requests": len(latencies),
+            "errors": errors,
+            "mean_ms": round(total / len(latencies) * 1000, 3),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+            "throughput_rps": round(len(latencies) / total, 1) if total > 0 else None,
+            "queries_per_request": round(sum(counted) / len(counted), 2) if counted else None
+        }
+
+def run_routes(target, workload, requests, warmup):
+    results = {}
+    for name, make_request in ROUTES:
+        latencies = []
+        queries = []
+        errors = 0
+        for i in range(warmup + requests):
+            # The request data is made in its own app context, the requests
+            # must not share one or they would share the database session
+            with app.app_context():
+                method, path, body, token = make_request(workload, i)
+            started = time.perf_counter()
+            status, statements = target.request(method, path, body, token)
+            elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            latencies.append(elapsed)
+            queries.append(statements)
+            if status >= 400:
+                errors += 1
+        results[name] = _summarize(latencies, queries, errors)
+        print("  {:<42} p50 {:>8.2f} ms  p99 {:>8.2f} ms  queries {}".format(
+            name, results[name]["p50_ms"], results[name]["p99_ms"], results[name]["queries_per_request"]), file=sys.stderr)
+    return results
+
+def run_size(size, args):
+    print("Dataset with {} users".format(size), file=sys.stderr)
+    with app.app_context():
+        dataset = generator.generate(size, args.seed)
+        workload = Workload(size, dataset)
+    target = HttpTarget(args.url) if args.url else TestClientTarget()
+    try:
+        routes = run_routes(target, workload, args.requests, args.warmup)
+    finally:
+        target.close()
+    return {"dataset": dataset, "routes": routes}
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every route of the API at several dataset sizes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000], help="number of users of each dataset")
+    parser.add_argument('--requests', type=int, default=50, help="measured requests per route")
+    parser.add_argument('--warmup', type=int, default=5, help="unmeasured requests per route before measuring")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the data generator")
+    parser.add_argument('--url', help="base url of a running server to benchmark instead of the test client")
+    parser.add_argument('--reset-database', action='store_true',
+                        help="allow replacing the configured database, required with --url")
+    parser.add_argument('--output', help="file to write the JSON results to, printed otherwise")
+    args = parser.parse_args(argv)
+    if min(args.sizes) <= CALLERS:
+        parser.error("the dataset sizes must be larger than {}".format(CALLERS))
+    if args.url and not args.reset_database:
+        parser.error("--url replaces the data in the configured database, confirm with --reset-database")
+
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    results = {}
+    for size in args.sizes:
+        temp_db = None
+        if not args.url:
+            temp_db = tempfile.mkstemp(suffix='.db')
+            app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + temp_db[1]
+        try:
+            results[str(size)] = run_size(size, args)
+        finally:
+            if temp_db is not None:
+                app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+                os.close(temp_db[0])
+                os.unlink(temp_db[1])
+
+    report = {
+            "commit": _git_commit(),
+            "created": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "target": args.url or "test_client",
+            "requests": args.requests,
+            "seed": args.seed,
+            "sizes": results
+        }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
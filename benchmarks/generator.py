@@ -0,0 +1,131 @@
+import random
+from datetime import datetime, timedelta
+from app import app, db, db_manager, models, passwords
+
+# Synthetic social graph generator used by the benchmarks. The data is
+# generated from a seed so the same dataset can be recreated when comparing
+# runs between commits.
+
+BENCH_PASSWORD = "bench123"
+
+# Follower and like popularity follows a power law, a few users are followed
+# by most and most users by a few.
+FOLLOW_ALPHA = 1.1
+LIKE_ALPHA = 1.2
+
+# Average number of users followed by a user, questions asked per user and
+# answers and likes per question.
+AVG_FOLLOWED = 20
+AVG_QUESTIONS = 3
+AVG_ANSWERS = 2
+AVG_LIKES = 4
+
+# Questions are spread over this many days before the generation time
+HISTORY_DAYS = 90
+
+def bench_username(i):
+    return "user{}".format(i)
+
+def bench_email(i):
+    return "user{}@bench.test".format(i)
+
+# Cumulative weights proportional to 1 / rank^alpha, used with random.choices
+def _power_law_weights(n, alpha):
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** alpha
+        cum_weights.append(total)
+    return cum_weights
+
+# A count with the given mean and a long tail, at most limit
+def _heavy_tailed(rng, mean, limit):
+    return min(limit, int(mean * (rng.paretovariate(2.0) - 1) * 2))
+
+# Picks up to k distinct items, favouring the first ones in population
+def _sample(rng, population, cum_weights, k):
+    picked = set()
+    for _ in range(3):
+        picked.update(rng.choices(population, cum_weights=cum_weights, k=k - len(picked)))
+        if len(picked) >= k:
+            break
+    return picked
+
+def _insert(table, rows):
+    for i in range(0, len(rows), 1000):
+        db.session.execute(table.insert(), rows[i:i + 1000])
+
+# Resets the database and fills it with n_users users, a power law followers
+# graph, questions across the course rooms and likes and answers on them.
+# Returns the number of rows generated per table.
+def generate(n_users, seed=0):
+    rng = random.Random(seed)
+    db_manager.init_db()
+    start = datetime.utcnow() - timedelta(days=HISTORY_DAYS)
+
+    # All users share one password hash, hashing a password per user would
+    # dominate the generation time
+    password_hash = passwords.hash_password(BENCH_PASSWORD)
+    user_ids = list(range(1, n_users + 1))
+    _insert(models.User.__table__, [{"id": i, "username": bench_username(i), "email": bench_email(i),
+                                     "password_hash": password_hash} for i in user_ids])
+
+    n_courses = max(3, n_users // 100)
+    course_ids = [course.id for course in db.session.query(models.Course)]
+    _insert(models.Course.__table__, [{"id": i, "course_code": "BENCH{}".format(i), "course_name": "Course {}".format(i)}
+                                      for i in range(len(course_ids) + 1, n_courses + 1)])
+    course_ids = list(range(1, max(n_courses, len(course_ids)) + 1))
+    course_weights = _power_law_weights(len(course_ids), 1.0)
+
+    # Users earlier in the list are more popular
+    popularity = _power_law_weights(n_users, FOLLOW_ALPHA)
+    follows = []
+    for follower_id in user_ids:
+        followed = _sample(rng, user_ids, popularity, _heavy_tailed(rng, AVG_FOLLOWED, n_users - 1))
+        followed.discard(follower_id)
+        follows.extend({"follower_id": follower_id, "followed_id": followed_id} for followed_id in followed)
+    _insert(models.followers, follows)
+
+    questions = []
+    for user_id in user_ids:
+        for _ in range(_heavy_tailed(rng, AVG_QUESTIONS, 500)):
+            questions.append({"id": len(questions) + 1, "user_id": user_id,
+                              "course_id": rng.choices(course_ids, cum_weights=course_weights)[0],
+                              "question_title": "Question {} about {}".format(len(questions) + 1, rng.choice(TOPICS)),
+                              "question_body": " ".join(rng.choice(TOPICS) for _ in range(20)),
+                              "timestamp": start + timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))})
+    _insert(models.Question.__table__, questions)
+
+    likes = []
+    answers = []
+    like_weights = _power_law_weights(n_users, LIKE_ALPHA)
+    for question in questions:
+        for liker_id in _sample(rng, user_ids, like_weights, _heavy_tailed(rng, AVG_LIKES, n_users)):
+            likes.append({"liker_id": liker_id, "liked_id": question["id"]})
+        for _ in range(_heavy_tailed(rng, AVG_ANSWERS, 200)):
+            answers.append({"user_id": rng.choice(user_ids), "question_id": question["id"],
+                            "answer_body": " ".join(rng.choice(TOPICS) for _ in range(10)),
+                            "timestamp": question["timestamp"] + timedelta(seconds=rng.randrange(86400))})
+    _insert(models.question_likes, likes)
+    _insert(models.Answer.__table__, answers)
+    db.session.commit()
+
+    # Derived data that the application otherwise maintains on write
+    db_manager.commit_course_change()
+    db_manager.reconcile_question_counters()
+    db_manager.rescore_trending(rebuild=True)
+    if app.config['FEED_TIMELINE_ENABLED']:
+        db_manager.rebuild_timelines()
+
+    return {
+            "users": n_users,
+            "courses": len(course_ids),
+            "followers": len(follows),
+            "questions": len(questions),
+            "question_likes": len(likes),
+            "answers": len(answers)
+        }
+
+TOPICS = ["android", "flask", "sqlalchemy", "matrix", "eigenvalue", "layout", "recyclerview",
+          "fragment", "intent", "gradle", "kotlin", "java", "json", "rest", "token", "database",
+          "migration", "vector", "basis", "determinant", "animation", "gesture", "thread", "async"]
@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from app import app, db
+from benchmarks import generator
+from benchmarks.driver import Workload, _git_commit, _percentile
+from config import engine_options
+
+# Concurrency benchmark of SQLite with SQLITE_PRODUCTION_MODE off and on.
+# A temporary SQLite database is generated for each mode, then --processes
+# forked processes, like gunicorn workers, call the API through the Flask
+# test client for --duration seconds. Each call is a write (liking or
+# following, and undoing it) with probability --write-ratio and a read of a
+# question list or question otherwise. Reported are the reads and writes per
+# second, their latency percentiles and the number of failed requests, which
+# are mostly "database is locked" errors.
+#
+#   $ python -m benchmarks.sqlite_concurrency --processes 8 --output sqlite.json
+
+READ_ROUTES = [
+    lambda w, i: ("GET", "/questions?limit=20"),
+    lambda w, i: ("GET", "/questions/{}".format(w.question_id(i))),
+    lambda w, i: ("GET", "/courses/{}/questions?limit=20".format(w.course_codes[i % len(w.course_codes)])),
+]
+
+# Every other write undoes the one before it
+WRITE_ROUTES = [
+    lambda w, i: ("POST", "/liked_questions/{}".format(w.question_id(i))),
+    lambda w, i: ("DELETE", "/liked_questions/{}".format(w.question_id(i))),
+    lambda w, i: ("POST", "/followed_users/" + w.other_username(i)),
+    lambda w, i: ("DELETE", "/followed_users/" + w.other_username(i)),
+]
+
+# The workload of the current run, inherited by the forked processes
+_workload = None
+
+def _run_process(args):
+    process, write_ratio, duration, seed = args
+    # The connections of the parent can not be used by the child
+    db.engine.dispose()
+    app.logger.disabled = True
+    client = app.test_client()
+    rng = random.Random(seed + process)
+    headers = {"Authorization": "Bearer " + _workload.token(process)}
+    results = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    reads = writes = 0
+    stop_at = time.monotonic() + duration
+    while time.monotonic() < stop_at:
+        if rng.random() < write_ratio:
+            kind = "write"
+            # The pair of a write and its undo use the same question or user
+            item = process + (writes // 2) * len(WRITE_ROUTES)
+            method, path = WRITE_ROUTES[writes % len(WRITE_ROUTES)](_workload, item)
+            writes += 1
+        else:
+            kind = "read"
+            method, path = READ_ROUTES[reads % len(READ_ROUTES)](_workload, process + reads)
+            reads += 1
+        started = time.perf_counter()
+        response = client.open(path, method=method, headers=headers)
+        results[kind].append(time.perf_counter() - started)
+        if response.status_code >= 500:
+            errors[kind] += 1
+    return results, errors
+
+def _summarize(latencies, errors, duration):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput_rps": round(len(latencies) / duration, 1),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 3)
+        }
+
+def run_mode(production, args):
+    global _workload
+    temp_db = tempfile.mkstemp(suffix='.db')
+    database_uri = 'sqlite:///' + temp_db[1]
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_uri, production)
+    app.config['SQLITE_PRODUCTION_MODE'] = production
+    try:
+        with app.app_context():
+            dataset = generator.generate(args.size, args.seed)
+            _workload = Workload(args.size, dataset)
+            db.session.remove()
+            db.engine.dispose()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(args.processes) as pool:
+            outputs = pool.map(_run_process, [(process, args.write_ratio, args.duration, args.seed)
+                                              for process in range(args.processes)])
+    finally:
+        os.close(temp_db[0])
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(temp_db[1] + suffix):
+                os.unlink(temp_db[1] + suffix)
+    result = {}
+    for kind in ("read", "write"):
+        latencies = [latency for results, errors in outputs for latency in results[kind]]
+        result[kind] = _summarize(latencies, sum(errors[kind] for results, errors in outputs), args.duration)
+    print("  production mode {:<5}  reads {:>8} req/s  p99 {:>9} ms  writes {:>8} req/s  p99 {:>9} ms  errors {}".format(
+        str(production), result["read"].get("throughput_rps"), result["read"].get("p99_ms"),
+        result["write"].get("throughput_rps"), result["write"].get("p99_ms"),
+        result["read"]["errors"] + result["write"]["errors"]), file=sys.stderr)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare SQLite read and write throughput with production mode off and on.")
+    parser.add_argument('--size', type=int, default=1000, help="number of users of the dataset")
+    parser.add_argument('--processes', type=int, default=4, help="number of concurrent processes")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of load with each mode")
+    parser.add_argument('--write-ratio', type=float, default=0.2, help="share of the requests that write")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the data generator")
+    parser.add_argument('--output', help="file to write the JSON results to, printed otherwise")
+    args = parser.parse_args(argv)
+
+    # Logging in the forked processes would interleave with the results
+    logging.getLogger('sqlalchemy').setLevel(logging.ERROR)
+    app.config['SQL_QUERY_STATS_ENABLED'] = False
+    results = {}
+    for production in (False, True):
+        results["on" if production else "off"] = run_mode(production, args)
+
+    report = {
+            "commit": _git_commit(),
+            "created": datetime.utcnow().isoformat(),
+            "processes": args.processes,
+            "write_ratio": args.write_ratio,
+            "duration": args.duration,
+            "size": args.size,
+            "production_mode": results
+        }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
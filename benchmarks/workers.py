@@ -0,0 +1,220 @@
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from app import app
+from benchmarks import generator
+from benchmarks.driver import Workload, _git_commit, _percentile
+
+# Compares gunicorn worker classes at a fixed memory budget. For each worker
+# class a server is started with one worker to measure the memory of a
+# worker, then restarted with as many workers as fit in --memory-mb and
+# loaded with --concurrency clients calling the I/O bound read routes for
+# --duration seconds. Reported are the throughput, the latency percentiles
+# and the total resident memory of the server.
+#
+# The data is generated into the database the application is configured with
+# (DATABASE_URL), which is also the one the servers use, and everything in it
+# is replaced:
+#
+#   $ DATABASE_URL=postgresql://... python -m benchmarks.workers --reset-database
+#
+# Linux only, the memory is read from /proc.
+
+# The routes the clients call, chosen round robin
+READ_ROUTES = [
+    lambda w, i: "/questions?limit=20",
+    lambda w, i: "/questions/{}".format(w.question_id(i)),
+    lambda w, i: "/courses/{}/questions?limit=20".format(w.course_codes[i % len(w.course_codes)]),
+    lambda w, i: "/search?q=" + generator.TOPICS[i % len(generator.TOPICS)],
+    lambda w, i: "/users/current",
+]
+
+# Resident memory in kB of a process and all of its descendants
+def _tree_rss(pid):
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open('/proc/{}/status'.format(current)) as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            with open('/proc/{0}/task/{0}/children'.format(current)) as children:
+                pending.extend(int(child) for child in children.read().split())
+        except FileNotFoundError:
+            continue
+    return total
+
+class Server(object):
+
+    def __init__(self, worker_class, workers, port, connections):
+        self.port = port
+        env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, GUNICORN_WORKER_CONNECTIONS=str(connections),
+                   METRICS_ENABLED='False', SQL_QUERY_STATS_ENABLED='False')
+        self.process = subprocess.Popen([sys.executable, '-m', 'gunicorn.app.wsgiapp', '-w', str(workers),
+                                         '-b', '127.0.0.1:{}'.format(port), '--log-level', 'warning', 'wsgi:app'],
+                                        env=env)
+
+    # Waits until the server answers
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("gunicorn exited with status {}".format(self.process.returncode))
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+                connection.request('GET', '/')
+                connection.getresponse().read()
+                connection.close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("gunicorn did not start in {} seconds".format(timeout))
+
+    def rss_kb(self):
+        return _tree_rss(self.process.pid)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+# Calls the read routes from concurrency threads until the duration has passed
+def run_load(port, workload, concurrency, duration, warmup):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def client(n):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        i = n
+        own = []
+        own_errors = 0
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            path = READ_ROUTES[i % len(READ_ROUTES)](workload, i)
+            request_started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={"Authorization": "Bearer " + workload.token(i)})
+                response = connection.getresponse()
+                response.read()
+                failed = response.status >= 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                failed = True
+            elapsed = time.perf_counter() - request_started
+            if now >= measure_from:
+                own.append(elapsed)
+                own_errors += failed
+            i += concurrency
+        connection.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += own_errors
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    if not latencies:
+        return {"requests": 0, "errors": errors[0]}
+    return {
+            "requests": len(latencies),
+            "errors": errors[0],
+            "throughput_rps": round(len(latencies) / duration, 1),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 3)
+        }
+
+def run_worker_class(worker_class, workload, args):
+    print("Worker class {}".format(worker_class), file=sys.stderr)
+    server = Server(worker_class, 1, args.port, args.connections)
+    try:
+        server.wait_ready()
+        # The memory of a worker once it has served requests
+        run_load(args.port, workload, args.concurrency, 2, 0)
+        single_kb = server.rss_kb()
+    finally:
+        server.stop()
+    workers = max(1, min(args.max_workers, args.memory_mb * 1024 // single_kb - 1))
+    if args.workers:
+        workers = args.workers
+
+    server = Server(worker_class, workers, args.port, args.connections)
+    try:
+        server.wait_ready()
+        load = run_load(args.port, workload, args.concurrency, args.duration, args.warmup)
+        load["rss_mb"] = round(server.rss_kb() / 1024, 1)
+    finally:
+        server.stop()
+    load["workers"] = workers
+    load["single_worker_rss_mb"] = round(single_kb / 1024, 1)
+    print("  {:<8} workers {:>3}  {:>8} req/s  p50 {:>8} ms  p99 {:>8} ms  rss {:>7} MB  errors {}".format(
+        worker_class, workers, load.get("throughput_rps"), load.get("p50_ms"), load.get("p99_ms"),
+        load["rss_mb"], load["errors"]), file=sys.stderr)
+    return load
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker classes at a fixed memory budget.")
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gevent'], help="worker classes to compare")
+    parser.add_argument('--size', type=int, default=1000, help="number of users of the dataset")
+    parser.add_argument('--memory-mb', type=int, default=512,
+                        help="memory budget of the server, sets the number of workers of each class")
+    parser.add_argument('--max-workers', type=int, default=16, help="upper limit of the number of workers")
+    parser.add_argument('--workers', type=int, help="fixed number of workers instead of the memory budget")
+    parser.add_argument('--connections', type=int, default=100, help="worker_connections of the gevent workers")
+    parser.add_argument('--concurrency', type=int, default=50, help="number of concurrent clients")
+    parser.add_argument('--duration', type=float, default=20, help="measured seconds of load per worker class")
+    parser.add_argument('--warmup', type=float, default=3, help="unmeasured seconds of load before measuring")
+    parser.add_argument('--port', type=int, default=8765, help="port the servers listen on")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the data generator")
+    parser.add_argument('--reset-database', action='store_true',
+                        help="allow replacing the configured database, required")
+    parser.add_argument('--output', help="file to write the JSON results to, printed otherwise")
+    args = parser.parse_args(argv)
+    if not args.reset_database:
+        parser.error("the benchmark replaces the data in the configured database, confirm with --reset-database")
+
+    with app.app_context():
+        dataset = generator.generate(args.size, args.seed)
+        workload = Workload(args.size, dataset)
+
+    results = {}
+    for worker_class in args.worker_classes:
+        results[worker_class] = run_worker_class(worker_class, workload, args)
+
+    report = {
+            "commit": _git_commit(),
+            "created": datetime.utcnow().isoformat(),
+            "dataset": dataset,
+            "memory_mb": args.memory_mb,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "worker_classes": results
+        }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,140 @@ import datetime
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Reads a boolean option from the environment, e.g. FEED_TIMELINE_ENABLED=True
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+# Connection pool options of the database engine. A gevent worker serves up to
+# worker_connections requests at once, each holding a connection while it
+# runs, so the pool is sized with DB_POOL_SIZE and DB_MAX_OVERFLOW for the
+# number of concurrent requests of one worker rather than for one request at
+# a time. SQLite file databases use no pool and take no options, except in
+# SQLite production mode where the connections are kept in a pool too.
+def engine_options(database_uri, sqlite_production=False):
+    pool_options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 5),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 10),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    }
+    if not database_uri.startswith('sqlite'):
+        return dict(pool_options, pool_pre_ping=True)
+    if not sqlite_production or database_uri in ('sqlite://', 'sqlite:///:memory:'):
+        return {}
+    # A pooled connection is used by one thread at a time, but not always by
+    # the thread that opened it
+    from sqlalchemy.pool import QueuePool
+    return dict(pool_options, poolclass=QueuePool, connect_args={'check_same_thread': False})
+
 class Config(object):
     
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'database.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Run SQLite in WAL mode with the pragmas below set on every connection,
+    # so that readers do not block the writer and a writer waits up to
+    # SQLITE_BUSY_TIMEOUT_MS for the lock instead of failing with "database
+    # is locked". For deployments that serve from a SQLite file
+    SQLITE_PRODUCTION_MODE = env_flag('SQLITE_PRODUCTION_MODE')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 16384)
+
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, SQLITE_PRODUCTION_MODE)
+
+    # Read replica of the database, the user and question lists, answers and
+    # search of GET requests are read from it when DATABASE_REPLICA_URL is
+    # set. After a write the same client reads from the primary for
+    # REPLICA_STICKY_SECONDS, which should cover the replication lag
+    SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_REPLICA_URL']} if os.environ.get('DATABASE_REPLICA_URL') else None
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS') or 5)
+
     JWT_SECRET_KEY = os.environ.get('SERVER_SECRET') or 'not-super-secret'
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ['access']
     JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=7)
+
+    # Password hashing, stored hashes made with other parameters are rehashed
+    # on the next successful login. The hashes are computed in a pool of
+    # PASSWORD_HASH_POOL_SIZE processes, or threads in gevent workers, 0
+    # hashes in the request worker
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:150000'
+    PASSWORD_HASH_SALT_LENGTH = int(os.environ.get('PASSWORD_HASH_SALT_LENGTH') or 8)
+    PASSWORD_HASH_POOL_SIZE = int(os.environ.get('PASSWORD_HASH_POOL_SIZE') or 2)
+
+    # Check token revocation against a process local cache of the token table
+    # that is reloaded every JWT_REVOCATION_CACHE_REFRESH_SECONDS, which is how
+    # long a token revoked by another worker may still be accepted
+    JWT_REVOCATION_CACHE_ENABLED = True
+    JWT_REVOCATION_CACHE_REFRESH_SECONDS = 30
+
+    # Send the number of SQL queries and the time spent on them for each
+    # request in the X-DB-Queries and X-DB-Time-ms response headers
+    SQL_QUERY_STATS_ENABLED = env_flag('SQL_QUERY_STATS_ENABLED')
+
+    # Export Prometheus metrics on /metrics. The route is not authenticated,
+    # only enable it where /metrics can not be reached from the internet
+    METRICS_ENABLED = env_flag('METRICS_ENABLED')
+
+    # How often the process local course catalog cache checks whether the
+    # course table was changed by another worker process
+    COURSE_CACHE_REFRESH_SECONDS = 10
+
+    # Buffer likes and unlikes in the worker and write them in batches every
+    # LIKE_FLUSH_INTERVAL_SECONDS. Repeated toggles of the same like are
+    # collapsed, and a request flushes the buffer itself when it holds
+    # LIKE_BUFFER_MAX_PENDING likes
+    LIKE_WRITE_BEHIND_ENABLED = env_flag('LIKE_WRITE_BEHIND_ENABLED')
+    LIKE_FLUSH_INTERVAL_SECONDS = float(os.environ.get('LIKE_FLUSH_INTERVAL_SECONDS') or 0.25)
+    LIKE_BUFFER_MAX_PENDING = 10000
+
+    # Largest number of usernames or question ids in a batch follow or like
+    BATCH_MAX_ITEMS = 100
+
+    # Stream the JSON of the unpaginated list routes while the rows are read,
+    # STREAMING_YIELD_PER rows at a time, in chunks of STREAMING_CHUNK_SIZE
+    # characters
+    STREAMING_RESPONSES_ENABLED = env_flag('STREAMING_RESPONSES_ENABLED')
+    STREAMING_YIELD_PER = 500
+    STREAMING_CHUNK_SIZE = 16384
+
+    # Encoder of the JSON responses, 'stdlib' or 'orjson'. orjson is faster but
+    # writes non ASCII characters as UTF-8 instead of \u escapes, the stdlib
+    # encoder is used if orjson is not installed
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER') or 'stdlib'
+
+    # Largest page size accepted by the paginated question lists
+    QUESTIONS_PAGE_MAX_LIMIT = 100
+
+    # Page size of /search when no limit is given
+    SEARCH_PAGE_SIZE = 20
+
+    # Trending questions, ranked by a stored hot score. Asking a question, a
+    # like and an answer add their weight to the score and the weight halves
+    # every TRENDING_HALF_LIFE_SECONDS. Run 'flask rescore-trending' about once
+    # an hour, workers reload its epoch every TRENDING_EPOCH_REFRESH_SECONDS
+    TRENDING_PAGE_SIZE = 20
+    TRENDING_HALF_LIFE_SECONDS = 6 * 60 * 60
+    TRENDING_QUESTION_WEIGHT = 1.0
+    TRENDING_LIKE_WEIGHT = 1.0
+    TRENDING_ANSWER_WEIGHT = 2.0
+    TRENDING_EPOCH_REFRESH_SECONDS = 60
+
+    # Who to follow suggestions, from an in memory copy of the followers table
+    # that each worker rebuilds every SUGGESTIONS_REFRESH_SECONDS. A shared
+    # course counts SUGGESTIONS_COURSE_WEIGHT of a mutual follow, and only the
+    # SUGGESTIONS_COURSE_PEERS most active users of each course are suggested
+    # for sharing it. A limit given by the client is capped at
+    # SUGGESTIONS_MAX_LIMIT
+    SUGGESTIONS_PAGE_SIZE = 10
+    SUGGESTIONS_MAX_LIMIT = 50
+    SUGGESTIONS_REFRESH_SECONDS = 300
+    SUGGESTIONS_COURSE_WEIGHT = 0.5
+    SUGGESTIONS_COURSE_PEERS = 200
+
+    # Serve the home feed from the materialized per follower timelines, run
+    # 'flask rebuild-timelines' before enabling it on an existing database
+    FEED_TIMELINE_ENABLED = env_flag('FEED_TIMELINE_ENABLED')
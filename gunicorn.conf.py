@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+
+# Gunicorn settings, loaded automatically by 'gunicorn wsgi:app' from the
+# project directory.
+
+# The workers share their Prometheus metrics through files in this directory,
+# it has to be set before the application is imported by the workers.
+multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                      os.path.join(tempfile.gettempdir(), 'prometheus_multiproc'))
+
+# Imported here and not in child_exit, which runs in the SIGCHLD handler of the
+# arbiter and can interrupt another import of the module on shutdown
+from prometheus_client import multiprocess
+
+# Worker class, 'sync' or 'gevent'. A gevent worker serves up to
+# worker_connections requests at once in greenlets, which switch while a
+# request waits for the database or the client, so a few gevent workers do
+# the work of many more sync workers. The database pool is sized for this
+# with DB_POOL_SIZE and DB_MAX_OVERFLOW, see config.py.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or 'sync'
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or 100)
+
+# Removes the metric files of a previous run, the counters start from zero
+def on_starting(server):
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+# Drops the live gauges of a worker that has exited
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
+
+# Writes the likes still buffered by a worker that is shutting down
+def worker_exit(server, worker):
+    from app.like_buffer import flush_on_exit
+    flush_on_exit()
+
+# Makes psycopg2 wait cooperatively in gevent workers, loads the revoked
+# token cache, the course catalog cache and the follower graph before the
+# worker accepts requests and starts the thread that rebuilds the graph. If
+# loading fails they are loaded by the first request that needs them instead
+def post_worker_init(worker):
+    from app import app, cooperative, db_manager
+    from app.follow_graph import follow_graph
+    from app.token_cache import revoked_tokens
+    if cooperative.is_gevent_patched():
+        cooperative.patch_psycopg()
+    with app.app_context():
+        try:
+            if app.config['JWT_REVOCATION_CACHE_ENABLED']:
+                revoked_tokens.refresh()
+            db_manager.get_all_courses()
+            follow_graph.load()
+        except Exception:
+            worker.log.exception('Could not load the revoked tokens, course catalog and follower graph')
+    follow_graph.start()
@@ -0,0 +1,62 @@
+"""full text search index over questions
+
+Revision ID: 46cf8050283d
+Revises: 8dc9d81bdd4c
+Create Date: 2026-10-17 13:05:12.734561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '46cf8050283d'
+down_revision = '8dc9d81bdd4c'
+branch_labels = None
+depends_on = None
+
+
+# Copies of app.models.QUESTION_FTS_SQLITE and QUESTION_SEARCH_VECTOR as they
+# were when this revision was written.
+QUESTION_FTS_SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS question_fts USING fts5(
+        question_title, question_body, content='question', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_insert AFTER INSERT ON question BEGIN
+        INSERT INTO question_fts(rowid, question_title, question_body)
+            VALUES (new.id, new.question_title, new.question_body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_delete AFTER DELETE ON question BEGIN
+        INSERT INTO question_fts(question_fts, rowid, question_title, question_body)
+            VALUES ('delete', old.id, old.question_title, old.question_body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_update AFTER UPDATE OF question_title, question_body ON question BEGIN
+        INSERT INTO question_fts(question_fts, rowid, question_title, question_body)
+            VALUES ('delete', old.id, old.question_title, old.question_body);
+        INSERT INTO question_fts(rowid, question_title, question_body)
+            VALUES (new.id, new.question_title, new.question_body);
+    END"""
+]
+QUESTION_SEARCH_VECTOR = ("setweight(to_tsvector('english', coalesce(question_title, '')), 'A') || "
+                          "setweight(to_tsvector('english', coalesce(question_body, '')), 'B')")
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in QUESTION_FTS_SQLITE:
+            op.execute(statement)
+        # Indexes the questions that already exist
+        op.execute("INSERT INTO question_fts(question_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute('CREATE INDEX ix_question_search ON question USING gin ((' + QUESTION_SEARCH_VECTOR + '))')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS question_fts_update')
+        op.execute('DROP TRIGGER IF EXISTS question_fts_delete')
+        op.execute('DROP TRIGGER IF EXISTS question_fts_insert')
+        op.execute('DROP TABLE IF EXISTS question_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX ix_question_search')
@@ -0,0 +1,57 @@
+"""lookup indexes and association table uniqueness
+
+Revision ID: 50d184ac30cf
+Revises: 627e8e8ba3a0
+Create Date: 2026-10-17 10:48:05.317260
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '50d184ac30cf'
+down_revision = '627e8e8ba3a0'
+branch_labels = None
+depends_on = None
+
+
+# Collapses rows of table that share the same values in columns into a single
+# row, so a unique index can be created on the columns.
+def deduplicate(table, columns):
+    conn = op.get_bind()
+    column_list = ', '.join(columns)
+    not_null = ' AND '.join('{} IS NOT NULL'.format(column) for column in columns)
+    matches = ' AND '.join('{0} = :{0}'.format(column) for column in columns)
+    values = ', '.join(':' + column for column in columns)
+    duplicates = conn.execute(sa.text('SELECT {1} FROM {0} WHERE {2} GROUP BY {1} HAVING COUNT(*) > 1'.format(
+        table, column_list, not_null))).fetchall()
+    for duplicate in duplicates:
+        row = dict(zip(columns, duplicate))
+        conn.execute(sa.text('DELETE FROM {} WHERE {}'.format(table, matches)), row)
+        conn.execute(sa.text('INSERT INTO {} ({}) VALUES ({})'.format(table, column_list, values)), row)
+
+
+def upgrade():
+    deduplicate('followers', ['follower_id', 'followed_id'])
+    deduplicate('question_likes', ['liker_id', 'liked_id'])
+    op.execute('DELETE FROM token WHERE id NOT IN (SELECT MIN(id) FROM token GROUP BY jti)')
+    # Duplicate likes were counted by the like counters
+    op.execute('UPDATE question SET '
+               'like_count = (SELECT COUNT(*) FROM question_likes WHERE question_likes.liked_id = question.id)')
+
+    op.create_index('ix_followers_follower_id_followed_id', 'followers', ['follower_id', 'followed_id'], unique=True)
+    op.create_index('ix_followers_followed_id', 'followers', ['followed_id'], unique=False)
+    op.create_index('ix_question_likes_liker_id_liked_id', 'question_likes', ['liker_id', 'liked_id'], unique=True)
+    op.create_index('ix_question_user_id_timestamp', 'question', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_answer_question_id_timestamp', 'answer', ['question_id', 'timestamp'], unique=False)
+    op.create_index(op.f('ix_token_jti'), 'token', ['jti'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_token_jti'), table_name='token')
+    op.drop_index('ix_answer_question_id_timestamp', table_name='answer')
+    op.drop_index('ix_question_user_id_timestamp', table_name='question')
+    op.drop_index('ix_question_likes_liker_id_liked_id', table_name='question_likes')
+    op.drop_index('ix_followers_followed_id', table_name='followers')
+    op.drop_index('ix_followers_follower_id_followed_id', table_name='followers')
@@ -0,0 +1,31 @@
+"""question like and answer counters
+
+Revision ID: 627e8e8ba3a0
+Revises: 857cb0d54839
+Create Date: 2026-10-17 10:03:27.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '627e8e8ba3a0'
+down_revision = '857cb0d54839'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('question', sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('question', sa.Column('answer_count', sa.Integer(), server_default='0', nullable=False))
+    # Fill in the counters of the existing questions
+    op.execute('UPDATE question SET '
+               'like_count = (SELECT COUNT(*) FROM question_likes WHERE question_likes.liked_id = question.id), '
+               'answer_count = (SELECT COUNT(*) FROM answer WHERE answer.question_id = question.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('question') as batch_op:
+        batch_op.drop_column('answer_count')
+        batch_op.drop_column('like_count')
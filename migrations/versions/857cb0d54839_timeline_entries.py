@@ -0,0 +1,33 @@
+"""timeline entries
+
+Revision ID: 857cb0d54839
+Revises: be35a1996c4e
+Create Date: 2026-10-17 09:12:41.208114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '857cb0d54839'
+down_revision = 'be35a1996c4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timeline_entry',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('question_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['question_id'], ['question.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'question_id')
+    )
+    op.create_index('ix_timeline_entry_user_id_timestamp', 'timeline_entry', ['user_id', 'timestamp', 'question_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_timeline_entry_user_id_timestamp', table_name='timeline_entry')
+    op.drop_table('timeline_entry')
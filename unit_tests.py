@@ -1,8 +1,17 @@
 import os
 import unittest
 import tempfile
+from unittest import mock
+from datetime import datetime, timedelta
 from flask import json
-from app import app, db_manager
+from flask_jwt_extended import decode_token, create_access_token
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from app import app, db, db_manager, models, passwords, replica
+from app.like_buffer import like_buffer
+from app.token_cache import revoked_tokens
+from app.follow_graph import build_csr, follow_graph
+from config import engine_options
 
 class TestCase(unittest.TestCase):
 
@@ -11,6 +20,23 @@ class TestCase(unittest.TestCase):
         basedir = os.path.abspath(os.path.dirname(temp_db[1]))
         self.db_fd = temp_db[0]
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, temp_db[1])
+        app.config['FEED_TIMELINE_ENABLED'] = False
+        app.config['JWT_REVOCATION_CACHE_REFRESH_SECONDS'] = 30
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:150000'
+        app.config['SQL_QUERY_STATS_ENABLED'] = True
+        app.config['COURSE_CACHE_REFRESH_SECONDS'] = 10
+        app.config['STREAMING_RESPONSES_ENABLED'] = False
+        app.config['STREAMING_YIELD_PER'] = 500
+        app.config['STREAMING_CHUNK_SIZE'] = 16384
+        app.config['JSON_PROVIDER'] = 'stdlib'
+        app.config['SQLITE_PRODUCTION_MODE'] = False
+        app.config['SQLALCHEMY_BINDS'] = None
+        app.config['REPLICA_STICKY_SECONDS'] = 5
+        app.config['LIKE_WRITE_BEHIND_ENABLED'] = False
+        app.config['LIKE_FLUSH_INTERVAL_SECONDS'] = 60
+        app.config['SUGGESTIONS_REFRESH_SECONDS'] = 300
+        app.config['SUGGESTIONS_MAX_LIMIT'] = 50
+        app.config['METRICS_ENABLED'] = False
         app.testing = True
         self.app = app.test_client()
         with app.app_context():
@@ -22,6 +48,13 @@ class TestCase(unittest.TestCase):
         # windows, will cause [WinError 123] otherwise.
         os.unlink(app.config['SQLALCHEMY_DATABASE_URI'][10:])
     
+    # Asserts that the request of response made at most max_queries SQL
+    # queries, used to pin the query budget of each route.
+    def assert_max_queries(self, response, max_queries):
+        queries = int(response.headers['X-DB-Queries'])
+        assert queries <= max_queries, "Made {} queries, the budget is {}".format(
+            queries, max_queries)
+
     # - - - INDEX TEST - - -
 
     def test_index(self):
@@ -90,6 +123,20 @@ class TestCase(unittest.TestCase):
         # Assert that the login failed
         assert rv_login_u1.json["msg"] == "Wrong password"
     
+    def test_login_after_hash_process_died(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # A process of the password hashing pool dies
+        for process in list(passwords._get_executor()._processes.values()):
+            process.kill()
+            process.join()
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        # Assert that the login succeeded on a new pool
+        assert rv_login_u1.json["token_type"] == "Bearer"
+
     def test_refresh_token(self):
         # Users
         u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
@@ -116,6 +163,116 @@ class TestCase(unittest.TestCase):
         # Assert correct token was revoked
         assert rv_refresh_token_u1.json["msg"] == "Logout successful"
 
+    def test_logout_revokes_token(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # Logout user 1 and use the token again
+        rv_logout_u1 = self.app.post('/logout', headers={"Authorization": acc_token_u1})
+        rv_u1_current = self.app.get('/users/current', headers={"Authorization": acc_token_u1})
+        # Assert that the token was revoked
+        assert rv_u1_current.json["msg"] == "Token has been revoked"
+
+    def test_token_revoked_by_other_worker(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        rv_u1_current_before = self.app.get('/users/current', headers={"Authorization": acc_token_u1})
+        # Revoke the token directly in the token table like another worker would
+        with app.app_context():
+            decoded_token = decode_token(rv_login_u1.json["access_token"])
+            db.session.add(models.Token(decoded_token["jti"], "access", u1["email"], datetime.now() + timedelta(days=1)))
+            db.session.commit()
+        rv_u1_current_cached = self.app.get('/users/current', headers={"Authorization": acc_token_u1})
+        # Force the cache to be refreshed
+        app.config['JWT_REVOCATION_CACHE_REFRESH_SECONDS'] = 0
+        rv_u1_current_refreshed = self.app.get('/users/current', headers={"Authorization": acc_token_u1})
+        # Assert that the revocation is only seen after the refresh
+        assert rv_u1_current_before.json["username"] == u1["username"]
+        assert rv_u1_current_cached.json["username"] == u1["username"]
+        assert rv_u1_current_refreshed.json["msg"] == "Token has been revoked"
+
+    def test_token_cache_refreshed_once(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1, with the cache warmed like gunicorn workers do on start
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        with app.app_context():
+            revoked_tokens.refresh()
+            # Revoke the token directly in the token table like another worker would
+            decoded_token = decode_token(rv_login_u1.json["access_token"])
+            db.session.add(models.Token(decoded_token["jti"], "access", u1["email"], datetime.now() + timedelta(days=1)))
+            db.session.commit()
+        # The cache is outdated while another request is reloading it
+        app.config['JWT_REVOCATION_CACHE_REFRESH_SECONDS'] = 0
+        with revoked_tokens._refresh_lock:
+            rv_u1_current_reloading = self.app.get('/users/current', headers={"Authorization": acc_token_u1})
+        rv_u1_current_reloaded = self.app.get('/users/current', headers={"Authorization": acc_token_u1})
+        # Assert that the request did not wait for the reload and read the old jtis
+        assert rv_u1_current_reloading.json["username"] == u1["username"]
+        assert rv_u1_current_reloaded.json["msg"] == "Token has been revoked"
+
+    def test_login_rehashes_password(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users with the old hashing parameters
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1 with new hashing parameters, then login again
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        rv_login_again_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        with app.app_context():
+            password_hash = db_manager.get_user_by_email(u1["email"]).password_hash
+        # Assert that the password was rehashed with the new parameters and still works
+        assert password_hash.startswith('pbkdf2:sha256:2000$')
+        assert rv_login_again_u1.json["token_type"] == "Bearer"
+
+    def test_login_token_claims(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1 and refresh the token
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        rv_refresh_token_u1 = self.app.post('/refresh_token', headers={"Authorization": acc_token_u1})
+        with app.app_context():
+            login_claims = decode_token(rv_login_u1.json["access_token"])["user_claims"]
+            refresh_claims = decode_token(rv_refresh_token_u1.json["access_token"])["user_claims"]
+        # Assert that both tokens carry the user id and username
+        assert login_claims == {"user_id": 1, "username": u1["username"]}
+        assert refresh_claims == login_claims
+
+    def test_token_without_claims(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Create a token for user 1 the way tokens were created before the claims were added
+        with app.app_context():
+            acc_token_u1 = "Bearer " + create_access_token(identity=u1["email"])
+        # Use the token to fetch the current user and follow user 2
+        rv_u1_current = self.app.get('/users/current', headers={"Authorization": acc_token_u1})
+        rv_u1_follows_u2 = self.app.post('/followed_users/' + u2["username"], headers={"Authorization": acc_token_u1})
+        rv_u1_all_followers = self.app.get('/followed_users', headers={"Authorization": acc_token_u1})
+        # Assert that the user was resolved from the email in the token
+        assert rv_u1_current.json == {"user_id": 1, "username": u1["username"], "email": u1["email"]}
+        assert rv_u1_all_followers.json["users"][0]["username"] == u2["username"]
+
     # - - - FOLLOW TESTS - - -
     
     def test_follow(self):
@@ -135,6 +292,31 @@ class TestCase(unittest.TestCase):
         # Assert that user 2 is followed by user 1
         assert rv1_u1_all_followers.json["users"][0]["username"] == u2["username"]
     
+    def test_follow_concurrent_duplicate(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 follows user 2, then follows again while the check misses the follow like a concurrent request would
+        rv_u1_follows_u2 = self.app.post('/followed_users/' + u2["username"], headers={"Authorization": acc_token_u1})
+        with mock.patch.object(db_manager, '_is_following', side_effect=[False, True]):
+            rv_u1_follows_u2_again = self.app.post('/followed_users/' + u2["username"], headers={"Authorization": acc_token_u1})
+        get_follow_states = db_manager._get_follow_states
+        stale_states = [{u2["username"]: (2, False)}]
+        def follow_states(following_user, usernames):
+            return stale_states.pop() if stale_states else get_follow_states(following_user, usernames)
+        with mock.patch.object(db_manager, '_get_follow_states', side_effect=follow_states):
+            rv_u1_follows_batch = self.app.post('/followed_users', data=json.dumps({"usernames": [u2["username"]]}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Assert that the duplicate follows are not errors and that the batch reports the follow
+        assert rv_u1_follows_u2_again.status_code == 200
+        assert rv_u1_follows_batch.json["results"] == [{"username": u2["username"], "status": "already_followed"}]
+        assert len(self.app.get('/followed_users', headers={"Authorization": acc_token_u1}).json["users"]) == 1
+
     def test_follow_non_existent_user(self):
         # Users
         u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
@@ -180,6 +362,49 @@ class TestCase(unittest.TestCase):
         # Assert that no user was found
         assert rv_u1_unfollows_non_existent.json["msg"] == "User does not exist"
     
+    def test_follow_batch(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        u3 = {"username": "nammers3","email": "namn.tredje@test.com","password": "namn789"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        rv_add_u3 = self.app.post('/users', data=json.dumps(u3), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 follows user 2, then user 2, user 3 and a non existent user at once
+        rv_u1_follows_u2 = self.app.post('/followed_users/' + u2["username"], headers={"Authorization": acc_token_u1})
+        usernames = [u2["username"], u3["username"], "nosuchuser"]
+        rv_u1_follows_batch = self.app.post('/followed_users', data=json.dumps({"usernames": usernames}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Assert that the status of each username is returned in order and that both users are followed
+        assert [result["status"] for result in rv_u1_follows_batch.json["results"]] == ["already_followed", "followed", "not_found"]
+        assert [result["username"] for result in rv_u1_follows_batch.json["results"]] == usernames
+        rv_u1_all_followed = self.app.get('/followed_users', headers={"Authorization": acc_token_u1})
+        assert sorted(user["username"] for user in rv_u1_all_followed.json["users"]) == [u2["username"], u3["username"]]
+        # User 1 unfollows user 3 twice in one batch
+        rv_u1_unfollows_batch = self.app.delete('/followed_users', data=json.dumps({"usernames": [u3["username"], u3["username"]]}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        assert [result["status"] for result in rv_u1_unfollows_batch.json["results"]] == ["unfollowed", "unfollowed"]
+        rv_u1_all_followed = self.app.get('/followed_users', headers={"Authorization": acc_token_u1})
+        assert [user["username"] for user in rv_u1_all_followed.json["users"]] == [u2["username"]]
+
+    def test_follow_batch_invalid(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 follows without a list, with a number and with too many usernames
+        rv_no_list = self.app.post('/followed_users', data=json.dumps({"usernames": "nammers2"}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        rv_number = self.app.post('/followed_users', data=json.dumps({"usernames": [2]}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        too_many = ["user{}".format(i) for i in range(app.config['BATCH_MAX_ITEMS'] + 1)]
+        rv_too_many = self.app.post('/followed_users', data=json.dumps({"usernames": too_many}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Assert that all are rejected
+        assert rv_no_list.status_code == 400 and rv_number.status_code == 400 and rv_too_many.status_code == 400
+    
     # - - - USER TESTS - - -
 
     def test_get_all_users(self):
@@ -199,6 +424,26 @@ class TestCase(unittest.TestCase):
         # Assert that user 2 is in the list and is followed by user 1
         assert rv_u1_users.json["users"][0]["is_followed"] == "True"
     
+    def test_get_all_users_follow_state(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        u3 = {"username": "nammers3","email": "namn.tredje@test.com","password": "namn789"}
+        # Register Users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        rv_add_u3 = self.app.post('/users', data=json.dumps(u3), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 follows user 3
+        rv_u1_follows_u3 = self.app.post('/followed_users/' + u3["username"], headers={"Authorization": acc_token_u1})
+        # Fetch all other users
+        rv_u1_users = self.app.get('/users', headers={"Authorization": acc_token_u1})
+        is_followed = {user["username"]: user["is_followed"] for user in rv_u1_users.json["users"]}
+        # Assert that only user 3 is followed by user 1
+        assert is_followed == {u2["username"]: "False", u3["username"]: "True"}
+
     def test_get_single_user(self):
         # Users
         u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
@@ -229,6 +474,90 @@ class TestCase(unittest.TestCase):
         # Assert that no user was found
         assert rv_u1_user2.json["msg"] == "User does not exist"
     
+    def test_user_suggestions(self):
+        # Users 1 to 6, logged in
+        tokens = []
+        for i in range(1, 7):
+            u = {"username": "nammers{}".format(i),"email": "namn{}@test.com".format(i),"password": "namn123"}
+            self.app.post('/users', data=json.dumps(u), content_type='application/json')
+            rv_login = self.app.post('/login', data=json.dumps({"email": u["email"], "password": u["password"]}), content_type='application/json')
+            tokens.append({"Authorization": rv_login.json["token_type"] + " " + rv_login.json["access_token"]})
+        # User 1 follows users 2 and 3, who both follow user 4, and user 3 follows user 5
+        self.app.post('/followed_users', data=json.dumps({"usernames": ["nammers2", "nammers3"]}), content_type='application/json', headers=tokens[0])
+        self.app.post('/followed_users/nammers4', headers=tokens[1])
+        self.app.post('/followed_users', data=json.dumps({"usernames": ["nammers4", "nammers5"]}), content_type='application/json', headers=tokens[2])
+        # Users 1, 5 and 6 ask questions in TDDD80
+        q = {"question_title": "Question","question_body": "Body", "course_room": "TDDD80"}
+        for i in [0, 4, 5]:
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers=tokens[i])
+        rv_suggestions = self.app.get('/suggested_users', headers=tokens[0])
+        # Assert that mutual follows rank above a shared course
+        assert [(u["username"], u["mutual_follows"], u["shared_courses"]) for u in rv_suggestions.json["users"]] == [
+            ("nammers4", 2, 0), ("nammers5", 1, 1), ("nammers6", 0, 1)]
+        # Assert that the limit is capped
+        app.config['SUGGESTIONS_MAX_LIMIT'] = 2
+        assert len(self.app.get('/suggested_users?limit=100', headers=tokens[0]).json["users"]) == 2
+        # User 1 follows user 4 and unfollows user 3
+        self.app.post('/followed_users/nammers4', headers=tokens[0])
+        self.app.delete('/followed_users/nammers3', headers=tokens[0])
+        rv_suggestions_after = self.app.get('/suggested_users?limit=1', headers=tokens[0])
+        # Assert that the graph was updated without reading the followers table
+        assert [(u["username"], u["mutual_follows"], u["shared_courses"]) for u in rv_suggestions_after.json["users"]] == [
+            ("nammers5", 0, 1)]
+        self.assert_max_queries(rv_suggestions_after, 1)
+        # User 1 follows user 6 in a transaction that is rolled back
+        with app.app_context():
+            db_manager._insert_follows(db_manager.get_user_by_username("nammers1"), [6])
+            db.session.rollback()
+        # Assert that user 6 is still suggested
+        assert "nammers6" in [u["username"] for u in self.app.get('/suggested_users', headers=tokens[0]).json["users"]]
+
+    def test_get_user_named_suggestions(self):
+        # Users
+        u1 = {"username": "suggestions","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # Fetch user 1 by username
+        rv_get_u1 = self.app.get('/users/suggestions', headers={"Authorization": acc_token_u1})
+        # Assert that the user is returned and not the suggestions
+        assert rv_get_u1.json["username"] == u1["username"]
+
+    def test_follow_graph_rebuilt_in_background(self):
+        # Users 1 to 3, logged in
+        tokens = []
+        for i in range(1, 4):
+            u = {"username": "nammers{}".format(i),"email": "namn{}@test.com".format(i),"password": "namn123"}
+            self.app.post('/users', data=json.dumps(u), content_type='application/json')
+            rv_login = self.app.post('/login', data=json.dumps({"email": u["email"], "password": u["password"]}), content_type='application/json')
+            tokens.append({"Authorization": rv_login.json["token_type"] + " " + rv_login.json["access_token"]})
+        # User 1 follows user 2, and another worker makes user 2 follow user 3 after the graph is built
+        self.app.post('/followed_users/nammers2', headers=tokens[0])
+        rv_suggestions = self.app.get('/suggested_users', headers=tokens[0])
+        app.config['SUGGESTIONS_REFRESH_SECONDS'] = 0
+        with app.app_context():
+            db.session.execute(models.followers.insert().values(follower_id=2, followed_id=3))
+            db.session.commit()
+        rv_suggestions_stale = self.app.get('/suggested_users', headers=tokens[0])
+        # Assert that the request does not rebuild the outdated graph
+        assert rv_suggestions.json["users"] == rv_suggestions_stale.json["users"] == []
+        self.assert_max_queries(rv_suggestions_stale, 1)
+        # Rebuild the graph like the refresher thread does
+        with app.app_context():
+            follow_graph.load()
+        # Assert that the rebuilt graph is used
+        assert [u["username"] for u in self.app.get('/suggested_users', headers=tokens[0]).json["users"]] == ["nammers3"]
+
+    def test_follow_graph_rows(self):
+        # Build the follows of users 0 and 5, and of no users
+        following = build_csr([(0, 1), (5, 2), (5, 3)])
+        empty = build_csr([])
+        # Assert that the rows are sized from the pairs and that other rows are empty
+        assert list(following.row(0)) == [1] and list(following.row(5)) == [2, 3]
+        assert list(following.row(3)) == [] and list(following.row(6)) == [] and list(empty.row(0)) == []
+
     # - - - QUESTION TESTS - - -
 
     def test_ask_question(self):
@@ -368,6 +697,307 @@ class TestCase(unittest.TestCase):
         # Assert that the like failed
         assert rv_u1_unlike_p1.json["msg"] == "Question does not exist"
     
+    def test_like_question_counter(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register Users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 asks a question
+        q1 = {"question_title": "How do i make nice application?","question_body": "Hello I would very much like to make a nice application for this excellent course, pls help.", "course_room": "TDDD80"}
+        rv_u1_asked_question = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # User 1 likes question 1 twice
+        rv_u1_like_p1 = self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        rv_u1_like_p1 = self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        rv_get_question_liked = self.app.get('/questions/1', headers={"Authorization": acc_token_u1})
+        # User 1 unlikes question 1 twice
+        rv_u1_unlike_p1 = self.app.delete('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        rv_u1_unlike_p1 = self.app.delete('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        rv_get_question_unliked = self.app.get('/questions/1', headers={"Authorization": acc_token_u1})
+        # Assert that the like was only counted once
+        assert rv_get_question_liked.json["likes"] == 1
+        assert rv_get_question_unliked.json["likes"] == 0
+
+    def test_like_questions_batch(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 asks two questions and likes question 1
+        for i in range(2):
+            q = {"question_title": "Question {}".format(i),"question_body": "Body", "course_room": "TDDD80"}
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers={"Authorization": acc_token_u1})
+        rv_u1_like_q1 = self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        # User 1 likes both questions, one of them twice, and two that do not exist at once
+        question_ids = [1, 2, "2", 7, "nosuchquestion"]
+        rv_u1_likes_batch = self.app.post('/liked_questions', data=json.dumps({"question_ids": question_ids}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Assert that the statuses are returned in order and that each like is counted once
+        assert [result["status"] for result in rv_u1_likes_batch.json["results"]] == ["already_liked", "liked", "liked", "not_found", "not_found"]
+        assert [result["question_id"] for result in rv_u1_likes_batch.json["results"]] == question_ids
+        assert self.app.get('/questions/1', headers={"Authorization": acc_token_u1}).json["likes"] == 1
+        assert self.app.get('/questions/2', headers={"Authorization": acc_token_u1}).json["likes"] == 1
+        # User 1 unlikes both questions
+        rv_u1_unlikes_batch = self.app.delete('/liked_questions', data=json.dumps({"question_ids": [1, 2]}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        rv_u1_unlikes_again = self.app.delete('/liked_questions', data=json.dumps({"question_ids": [1]}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Assert that the likes are removed
+        assert [result["status"] for result in rv_u1_unlikes_batch.json["results"]] == ["unliked", "unliked"]
+        assert [result["status"] for result in rv_u1_unlikes_again.json["results"]] == ["not_liked"]
+        assert self.app.get('/questions/1', headers={"Authorization": acc_token_u1}).json["likes"] == 0
+        assert self.app.get('/questions/2', headers={"Authorization": acc_token_u1}).json["is_liking"] == "False"
+
+    def test_like_concurrent_duplicate(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 asks and likes a question
+        q1 = {"question_title": "Question","question_body": "Body", "course_room": "TDDD80"}
+        rv_u1_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        rv_u1_like_q1 = self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        # User 1 likes the question again while the checks miss the like like a concurrent request would
+        with mock.patch.object(db_manager, '_is_liking_question', side_effect=[False, True]):
+            rv_u1_like_q1_again = self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        get_like_states = db_manager._get_like_states
+        stale_states = [{1: False}]
+        def like_states(user, question_ids):
+            return stale_states.pop() if stale_states else get_like_states(user, question_ids)
+        with mock.patch.object(db_manager, '_get_like_states', side_effect=like_states):
+            rv_u1_likes_batch = self.app.post('/liked_questions', data=json.dumps({"question_ids": [1]}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Assert that the duplicate likes are not errors and are not counted
+        assert rv_u1_like_q1_again.status_code == 200
+        assert rv_u1_likes_batch.json["results"] == [{"question_id": 1, "status": "already_liked"}]
+        assert self.app.get('/questions/1', headers={"Authorization": acc_token_u1}).json["likes"] == 1
+
+    def test_like_questions_batch_invalid_ids(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 asks a question
+        q1 = {"question_title": "Question","question_body": "Body", "course_room": "TDDD80"}
+        rv_u1_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # User 1 likes and unlikes with ids that are not integers
+        question_ids = [True, 1.7, 1.0, "1.0", " 1", "+1", None, [1], {"id": 1}]
+        rv_u1_likes_batch = self.app.post('/liked_questions', data=json.dumps({"question_ids": question_ids}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        rv_u1_unlikes_batch = self.app.delete('/liked_questions', data=json.dumps({"question_ids": question_ids}), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Assert that none of them is taken for question 1
+        assert [result["status"] for result in rv_u1_likes_batch.json["results"]] == ["not_found"] * len(question_ids)
+        assert [result["status"] for result in rv_u1_unlikes_batch.json["results"]] == ["not_found"] * len(question_ids)
+        assert self.app.get('/questions/1', headers={"Authorization": acc_token_u1}).json["likes"] == 0
+
+    def test_like_write_behind(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        headers = {"Authorization": acc_token_u1}
+        # User 1 asks two questions
+        for i in range(2):
+            q = {"question_title": "Question {}".format(i),"question_body": "Body", "course_room": "TDDD80"}
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers=headers)
+        rv_get_q1 = self.app.get('/questions/1', headers=headers)
+        # User 1 likes question 1 with the likes buffered
+        app.config['LIKE_WRITE_BEHIND_ENABLED'] = True
+        rv_u1_like_q1 = self.app.post('/liked_questions/1', headers=headers)
+        # Assert that the like is not written yet, but seen by user 1
+        self.assert_max_queries(rv_u1_like_q1, 1)
+        with app.app_context():
+            assert db.session.query(models.question_likes).count() == 0
+        rv_get_q1_liked = self.app.get('/questions/1', headers={"Authorization": acc_token_u1, "If-None-Match": rv_get_q1.headers["ETag"]})
+        assert rv_get_q1_liked.status_code == 200
+        assert rv_get_q1_liked.json["is_liking"] == "True" and rv_get_q1_liked.json["likes"] == 1
+        # User 1 likes both questions, then toggles the like of question 1 until it is unliked
+        rv_u1_likes_batch = self.app.post('/liked_questions', data=json.dumps({"question_ids": [1, 2]}), content_type='application/json', headers=headers)
+        self.app.delete('/liked_questions/1', headers=headers)
+        self.app.post('/liked_questions/1', headers=headers)
+        self.app.delete('/liked_questions/1', headers=headers)
+        rv_myquestions = self.app.get('/myquestions', headers=headers)
+        # Assert that the statuses and the lists include the buffered likes
+        assert [result["status"] for result in rv_u1_likes_batch.json["results"]] == ["already_liked", "liked"]
+        assert [(q["question_id"], q["is_liking"], q["likes"]) for q in rv_myquestions.json["questions"]] == [(2, "True", 1), (1, "False", 0)]
+        # Flush the buffer
+        written = like_buffer.flush()
+        # Assert that the toggles of question 1 were collapsed and only the like of question 2 was written
+        assert written == 1
+        with app.app_context():
+            assert db.session.query(models.question_likes.c.liker_id, models.question_likes.c.liked_id).all() == [(1, 2)]
+            assert [q.like_count for q in db.session.query(models.Question).order_by(models.Question.id)] == [0, 1]
+        assert len(like_buffer) == 0
+        assert self.app.get('/questions/2', headers=headers).json["likes"] == 1
+        # User 1 unlikes question 2 and the buffer is flushed
+        with app.app_context():
+            scores = [q.hot_score for q in db.session.query(models.Question).order_by(models.Question.id)]
+            like_weight = db_manager._get_like_weights(1, [2])[2]
+        self.app.delete('/liked_questions/2', headers=headers)
+        like_buffer.flush()
+        # Assert that the unlike removed the weight the like added
+        with app.app_context():
+            assert [q.like_count for q in db.session.query(models.Question).order_by(models.Question.id)] == [0, 0]
+            assert abs(models.Question.query.get(2).hot_score - (scores[1] - like_weight)) < 1e-9
+
+    def test_get_course_questions(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        rv_login_u2 = self.app.post('/login', data=json.dumps({"email": u2["email"], "password": u2["password"]}), content_type='application/json')
+        acc_token_u2 = rv_login_u2.json["token_type"] + " " + rv_login_u2.json["access_token"]
+        # Both users ask questions in two courses, user 1 likes question 3
+        for i, course_room in enumerate(["TDDD80", "TATA24", "TDDD80", "TDDD80"]):
+            q = {"question_title": "Question {}".format(i),"question_body": "Body", "course_room": course_room}
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers={"Authorization": [acc_token_u1, acc_token_u2][i % 2]})
+        rv_u1_like_q3 = self.app.post('/liked_questions/3', headers={"Authorization": acc_token_u1})
+        # Fetch the questions in TDDD80, all at once and two at a time
+        rv_course = self.app.get('/courses/TDDD80/questions', headers={"Authorization": acc_token_u1})
+        rv_page_1 = self.app.get('/courses/TDDD80/questions?limit=2', headers={"Authorization": acc_token_u1})
+        rv_page_2 = self.app.get('/courses/TDDD80/questions?limit=2&before=' + rv_page_1.json["next_cursor"], headers={"Authorization": acc_token_u1})
+        # Assert that only the questions of the course are listed, newest first, with the liked state of user 1
+        assert [q["question_id"] for q in rv_course.json["questions"]] == [4, 3, 1]
+        assert [q["is_liking"] for q in rv_course.json["questions"]] == ["False", "True", "False"]
+        assert [q["question_id"] for q in rv_page_1.json["questions"]] == [4, 3]
+        assert [q["question_id"] for q in rv_page_2.json["questions"]] == [1]
+        assert rv_page_2.json["next_cursor"] is None
+        # Assert that the course must exist
+        rv_no_course = self.app.get('/courses/nosuchcourse/questions', headers={"Authorization": acc_token_u1})
+        assert rv_no_course.status_code == 404 and rv_no_course.json["msg"] == "This course does not exist"
+
+    def test_search_questions(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        headers = {"Authorization": acc_token_u1}
+        # User 1 asks three questions
+        q1 = {"question_title": "Flask routes","question_body": "How do I add a route to my application?", "course_room": "TDDD80"}
+        q2 = {"question_title": "Eigenvalues","question_body": "Which routes lead to the eigenvalues of a matrix?", "course_room": "TATA24"}
+        q3 = {"question_title": "Android layouts","question_body": "How do I center a button?", "course_room": "TDDC73"}
+        for q in (q1, q2, q3):
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers=headers)
+        # Search for routes, in one course and one result per page
+        rv_search = self.app.get('/search?q=route', headers=headers)
+        rv_search_course = self.app.get('/search?q=routes&course=TATA24', headers=headers)
+        rv_search_page_1 = self.app.get('/search?q=routes&limit=1', headers=headers)
+        rv_search_page_2 = self.app.get('/search?q=routes&limit=1&offset=' + str(rv_search_page_1.json["next_offset"]), headers=headers)
+        # Assert that the title match ranks first and that the results are filtered and paginated
+        assert [q["question_id"] for q in rv_search.json["questions"]] == [1, 2]
+        assert rv_search.json["questions"][0]["is_liking"] == "False" and rv_search.json["next_offset"] is None
+        assert [q["question_id"] for q in rv_search_course.json["questions"]] == [2]
+        assert [q["question_id"] for q in rv_search_page_1.json["questions"]] == [1]
+        assert [q["question_id"] for q in rv_search_page_2.json["questions"]] == [2]
+        assert rv_search_page_2.json["next_offset"] is None
+        # Assert that all words must match and that query syntax is ignored
+        assert [q["question_id"] for q in self.app.get('/search?q=how+button', headers=headers).json["questions"]] == [3]
+        assert self.app.get('/search?q=%22button%22*', headers=headers).json["questions"][0]["question_id"] == 3
+        self.assert_max_queries(self.app.get('/search?q=how', headers=headers), 2)
+
+    def test_search_questions_invalid(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # Search without words and in a non existent course
+        rv_search_empty = self.app.get('/search?q=%20%3F', headers={"Authorization": acc_token_u1})
+        rv_search_course = self.app.get('/search?q=help&course=nosuchcourse', headers={"Authorization": acc_token_u1})
+        # Assert that both are rejected
+        assert rv_search_empty.status_code == 400 and rv_search_empty.json["msg"] == "Missing search query"
+        assert rv_search_course.json["msg"] == "This course does not exist"
+
+    def test_trending_questions(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Login users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        rv_login_u2 = self.app.post('/login', data=json.dumps({"email": u2["email"], "password": u2["password"]}), content_type='application/json')
+        headers_u1 = {"Authorization": rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]}
+        headers_u2 = {"Authorization": rv_login_u2.json["token_type"] + " " + rv_login_u2.json["access_token"]}
+        # User 1 asks three questions
+        q1 = {"question_title": "Flask routes","question_body": "How do I add a route?", "course_room": "TDDD80"}
+        q2 = {"question_title": "Eigenvalues","question_body": "How do I find them?", "course_room": "TATA24"}
+        q3 = {"question_title": "Flask models","question_body": "How do I add a column?", "course_room": "TDDD80"}
+        for q in (q1, q2, q3):
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers=headers_u1)
+        trending_ids = lambda path, headers=headers_u1: [q["question_id"] for q in self.app.get(path, headers=headers).json["questions"]]
+        # Assert that the newest question trends first without likes and answers
+        assert trending_ids('/questions/trending') == [3, 2, 1]
+        # User 2 likes question 1 and user 1 answers question 2
+        self.app.post('/liked_questions/1', headers=headers_u2)
+        self.app.post('/answer_question/2', data=json.dumps({"answer_body": "Solve det(A - tI) = 0"}), content_type='application/json', headers=headers_u1)
+        rv_page_1 = self.app.get('/questions/trending?limit=1', headers=headers_u2)
+        rv_page_2 = self.app.get('/questions/trending?limit=2&offset=' + str(rv_page_1.json["next_offset"]), headers=headers_u2)
+        # Assert that an answer counts more than a like and that the results are filtered and paginated
+        assert trending_ids('/questions/trending') == [2, 1, 3]
+        assert trending_ids('/questions/trending?course=TDDD80') == [1, 3]
+        assert [q["question_id"] for q in rv_page_1.json["questions"]] == [2]
+        assert [q["question_id"] for q in rv_page_2.json["questions"]] == [1, 3] and rv_page_2.json["next_offset"] is None
+        assert rv_page_2.json["questions"][0]["is_liking"] == "True"
+        assert self.app.get('/questions/trending?course=nosuchcourse', headers=headers_u1).status_code == 404
+        # User 2 unlikes question 1
+        self.app.delete('/liked_questions/1', headers=headers_u2)
+        # Assert that the like no longer counts
+        assert trending_ids('/questions/trending') == [2, 3, 1]
+        # Rescore an hour after the epoch and rebuild the scores from the counts
+        with app.app_context():
+            stamp = models.VersionStamp.query.get('trending_epoch')
+            epoch = stamp.version
+            stamp.version = epoch - 60
+            db.session.commit()
+            score = models.Question.query.get(2).hot_score
+            assert db_manager.rescore_trending() == 3
+            # Assert that the epoch moved and the scores decayed without changing their order
+            assert models.VersionStamp.query.get('trending_epoch').version >= epoch
+            assert models.Question.query.get(2).hot_score < score
+        assert trending_ids('/questions/trending') == [2, 3, 1]
+        with app.app_context():
+            assert db_manager.rescore_trending(rebuild=True) == 3
+        assert trending_ids('/questions/trending') == [2, 3, 1]
+        self.assert_max_queries(self.app.get('/questions/trending', headers=headers_u1), 2)
+        # User 2 likes question 3 an hour before the next rescore
+        with app.app_context():
+            scores = {q.id: q.hot_score for q in models.Question.query}
+        self.app.post('/liked_questions/3', headers=headers_u2)
+        with app.app_context():
+            models.VersionStamp.query.get('trending_epoch').version -= 60
+            liked_at = db.session.query(models.question_likes.c.timestamp).scalar()
+            db.session.execute(models.question_likes.update().values(timestamp=liked_at - timedelta(hours=1)))
+            db.session.commit()
+            db_manager.rescore_trending()
+            factor = models.Question.query.get(2).hot_score / scores[2]
+        # User 2 unlikes question 3 after the rescore
+        self.app.delete('/liked_questions/3', headers=headers_u2)
+        # Assert that the unlike removed the weight the like added an hour ago
+        with app.app_context():
+            assert factor < 1
+            assert abs(models.Question.query.get(3).hot_score - scores[3] * factor) < 1e-9
+
     # - - - ANSWER TESTS - - -
 
     def test_answer_question(self):
@@ -405,3 +1035,474 @@ class TestCase(unittest.TestCase):
         rv_get_answers = self.app.get('/answers/1', headers={"Authorization": acc_token_u1})
 
         assert rv_get_answers.json["answers"][0]["author"]["email"] == u1["email"]
+
+    def test_get_questions_likes_and_answers(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        rv_login_u2 = self.app.post('/login', data=json.dumps({"email": u2["email"], "password": u2["password"]}), content_type='application/json')
+        acc_token_u2 = rv_login_u2.json["token_type"] + " " + rv_login_u2.json["access_token"]
+        # User 2 asks two questions
+        q1 = {"question_title": "First question","question_body": "First body", "course_room": "TDDD80"}
+        q2 = {"question_title": "Second question","question_body": "Second body", "course_room": "TATA24"}
+        rv_u2_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u2})
+        rv_u2_asked_q2 = self.app.post('/questions', data=json.dumps(q2), content_type='application/json', headers={"Authorization": acc_token_u2})
+        # User 1 follows user 2, likes and answers question 1
+        rv_u1_follows_u2 = self.app.post('/followed_users/' + u2["username"], headers={"Authorization": acc_token_u1})
+        rv_u1_like_q1 = self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        a1 = {"answer_body": "This is how you do it!"}
+        rv_u1_answer_q1 = self.app.post('/answer_question/1', data=json.dumps(a1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Fetch the questions from users followed by user 1
+        rv_get_questions = self.app.get('/questions', headers={"Authorization": acc_token_u1})
+        questions = {question["question_id"]: question for question in rv_get_questions.json["questions"]}
+        # Assert that the counts and liked state are correct for both questions
+        assert questions[1]["likes"] == 1 and questions[1]["answers"] == 1 and questions[1]["is_liking"] == "True"
+        assert questions[2]["likes"] == 0 and questions[2]["answers"] == 0 and questions[2]["is_liking"] == "False"
+        assert questions[2]["course"]["course_code"] == "TATA24"
+
+    def test_get_questions_paginated(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 asks three questions
+        for i in range(3):
+            q = {"question_title": "Question {}".format(i),"question_body": "Body", "course_room": "TDDD80"}
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Fetch the questions of user 1 two at a time
+        rv_page_1 = self.app.get('/myquestions?limit=2', headers={"Authorization": acc_token_u1})
+        rv_page_2 = self.app.get('/myquestions?limit=2&before=' + rv_page_1.json["next_cursor"], headers={"Authorization": acc_token_u1})
+        # Assert that the pages are newest first and that the last page has no cursor
+        assert [q["question_id"] for q in rv_page_1.json["questions"]] == [3, 2]
+        assert [q["question_id"] for q in rv_page_2.json["questions"]] == [1]
+        assert rv_page_2.json["next_cursor"] is None
+
+    def test_get_questions_invalid_cursor(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # Fetch the questions using a malformed cursor
+        rv_get_questions = self.app.get('/questions?limit=2&before=nosuchcursor', headers={"Authorization": acc_token_u1})
+        # Assert that the cursor was rejected
+        assert rv_get_questions.json["msg"] == "Invalid cursor"
+
+    # - - - TIMELINE TESTS - - -
+
+    def test_get_questions_from_timeline(self):
+        app.config['FEED_TIMELINE_ENABLED'] = True
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        rv_login_u2 = self.app.post('/login', data=json.dumps({"email": u2["email"], "password": u2["password"]}), content_type='application/json')
+        acc_token_u2 = rv_login_u2.json["token_type"] + " " + rv_login_u2.json["access_token"]
+        # User 2 asks a question before and after user 1 follows user 2
+        q1 = {"question_title": "Before follow","question_body": "Body", "course_room": "TDDD80"}
+        q2 = {"question_title": "After follow","question_body": "Body", "course_room": "TDDD80"}
+        rv_u2_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u2})
+        rv_u1_follows_u2 = self.app.post('/followed_users/' + u2["username"], headers={"Authorization": acc_token_u1})
+        rv_u2_asked_q2 = self.app.post('/questions', data=json.dumps(q2), content_type='application/json', headers={"Authorization": acc_token_u2})
+        # Fetch the timeline of user 1
+        rv_get_questions = self.app.get('/questions', headers={"Authorization": acc_token_u1})
+        # Assert that both the backfilled and the fanned out question are in the timeline
+        assert [q["question_title"] for q in rv_get_questions.json["questions"]] == ["After follow", "Before follow"]
+        # User 1 unfollows user 2
+        rv_u1_unfollows_u2 = self.app.delete('/followed_users/' + u2["username"], headers={"Authorization": acc_token_u1})
+        rv_get_questions = self.app.get('/questions', headers={"Authorization": acc_token_u1})
+        # Assert that the questions of user 2 were removed from the timeline
+        assert rv_get_questions.json["questions"] == []
+        # User 1 follows and unfollows user 2 again through the batch routes
+        batch = json.dumps({"usernames": [u2["username"]]})
+        rv_u1_follows_batch = self.app.post('/followed_users', data=batch, content_type='application/json', headers={"Authorization": acc_token_u1})
+        rv_get_questions = self.app.get('/questions', headers={"Authorization": acc_token_u1})
+        assert len(rv_get_questions.json["questions"]) == 2
+        rv_u1_unfollows_batch = self.app.delete('/followed_users', data=batch, content_type='application/json', headers={"Authorization": acc_token_u1})
+        rv_get_questions = self.app.get('/questions', headers={"Authorization": acc_token_u1})
+        assert rv_get_questions.json["questions"] == []
+
+    def test_rebuild_timelines(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        rv_login_u2 = self.app.post('/login', data=json.dumps({"email": u2["email"], "password": u2["password"]}), content_type='application/json')
+        acc_token_u2 = rv_login_u2.json["token_type"] + " " + rv_login_u2.json["access_token"]
+        # User 1 follows user 2 and user 2 asks a question without timeline mode
+        rv_u1_follows_u2 = self.app.post('/followed_users/' + u2["username"], headers={"Authorization": acc_token_u1})
+        q1 = {"question_title": "Before timelines","question_body": "Body", "course_room": "TDDD80"}
+        rv_u2_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u2})
+        # Rebuild the timelines and enable timeline mode
+        result = app.test_cli_runner().invoke(args=['rebuild-timelines'])
+        app.config['FEED_TIMELINE_ENABLED'] = True
+        rv_get_questions = self.app.get('/questions', headers={"Authorization": acc_token_u1})
+        # Assert that the existing question was added to the timeline of user 1
+        assert result.output == "Rebuilt timelines with 1 entries\n"
+        assert rv_get_questions.json["questions"][0]["question_title"] == "Before timelines"
+
+    def test_reconcile_counters(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register Users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 asks, likes and answers a question
+        q1 = {"question_title": "How do i make nice application?","question_body": "Hello I would very much like to make a nice application for this excellent course, pls help.", "course_room": "TDDD80"}
+        rv_u1_asked_question = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        rv_u1_like_p1 = self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u1})
+        a1 = {"answer_body": "This is how you do it!"}
+        rv_u1_answer_question = self.app.post('/answer_question/1', data=json.dumps(a1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Break the stored counters
+        with app.app_context():
+            db.session.query(models.Question).update({"like_count": 5, "answer_count": 0})
+            db.session.commit()
+        # Reconcile the counters
+        result = app.test_cli_runner().invoke(args=['reconcile-counters'])
+        rv_get_question = self.app.get('/questions/1', headers={"Authorization": acc_token_u1})
+        # Assert that the counters were repaired
+        assert result.output == "Repaired the counters of 1 questions\n"
+        assert rv_get_question.json["likes"] == 1 and rv_get_question.json["answers"] == 1
+
+    # - - - STREAMING TESTS - - -
+
+    def test_streamed_lists_identical(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        headers = {"Authorization": acc_token_u1}
+        paths = ['/users', '/followed_users', '/questions', '/myquestions', '/answers/1']
+        # User 1 asks a question
+        q = {"question_title": "Question","question_body": "Body", "course_room": "TDDD80"}
+        self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers=headers)
+        # Five other users that each ask, like and answer a question and are followed by user 1
+        for i in range(5):
+            u = {"username": "other{}".format(i),"email": "other{}@test.com".format(i),"password": "namn456"}
+            self.app.post('/users', data=json.dumps(u), content_type='application/json')
+            rv_login_u = self.app.post('/login', data=json.dumps({"email": u["email"], "password": u["password"]}), content_type='application/json')
+            acc_token_u = rv_login_u.json["token_type"] + " " + rv_login_u.json["access_token"]
+            q = {"question_title": "Question {}".format(i),"question_body": "Body", "course_room": "TDDD80"}
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers={"Authorization": acc_token_u})
+            self.app.post('/liked_questions/{}'.format(i + 1), headers=headers)
+            self.app.post('/answer_question/1', data=json.dumps({"answer_body": "Answer {}".format(i)}), content_type='application/json', headers={"Authorization": acc_token_u})
+            self.app.post('/followed_users/' + u["username"], headers=headers)
+        # Fetch the lists without and with streaming, in small batches and chunks
+        buffered = [self.app.get(path, headers=headers) for path in paths]
+        app.config['STREAMING_RESPONSES_ENABLED'] = True
+        app.config['STREAMING_YIELD_PER'] = 2
+        app.config['STREAMING_CHUNK_SIZE'] = 100
+        streamed = [self.app.get(path, headers=headers, buffered=True) for path in paths]
+        # Assert that the responses are streamed, without a length, and identical
+        for buffered_response, streamed_response in zip(buffered, streamed):
+            assert "Content-Length" not in streamed_response.headers and "Content-Length" in buffered_response.headers
+            assert streamed_response.data == buffered_response.data
+            assert streamed_response.mimetype == buffered_response.mimetype
+        assert len(streamed[0].json["users"]) == 5 and len(streamed[2].json["questions"]) == 5
+        # Assert that empty lists are identical and that paginated lists are not streamed
+        assert self.app.get('/answers/2', headers=headers, buffered=True).data == b'{"answers":[]}\n'
+        app.config['STREAMING_RESPONSES_ENABLED'] = False
+        assert self.app.get('/answers/2', headers=headers).data == b'{"answers":[]}\n'
+        app.config['STREAMING_RESPONSES_ENABLED'] = True
+        assert "Content-Length" in self.app.get('/questions?limit=2', headers=headers).headers
+
+    # - - - JSON PROVIDER TESTS - - -
+
+    def test_json_providers_identical(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        headers = {"Authorization": acc_token_u1}
+        # User 1 follows user 2, asks, likes and answers a question
+        rv_u1_follows_u2 = self.app.post('/followed_users/' + u2["username"], headers=headers)
+        q1 = {"question_title": "Åsa frågar","question_body": "Hur gör jag en lista i Kotlin? ✓", "course_room": "TDDD80"}
+        rv_u1_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers=headers)
+        rv_u1_like_q1 = self.app.post('/liked_questions/1', headers=headers)
+        rv_u1_answer_q1 = self.app.post('/answer_question/1', data=json.dumps({"answer_body": "Så här gör du"}), content_type='application/json', headers=headers)
+        paths = ['/users', '/users/current', '/followed_users', '/myquestions', '/myquestions?limit=1', '/questions/1', '/answers/1', '/courses']
+        # Fetch the routes with the stdlib and the orjson provider, and one that does not exist
+        app.config['JSON_PROVIDER'] = 'stdlib'
+        stdlib = [self.app.get(path, headers=headers).data for path in paths]
+        app.config['JSON_PROVIDER'] = 'orjson'
+        orjson = [self.app.get(path, headers=headers).data for path in paths]
+        app.config['JSON_PROVIDER'] = 'nosuchprovider'
+        fallback = [self.app.get(path, headers=headers).data for path in paths]
+        # Assert that the responses are identical, including the dates and the null cursor
+        assert stdlib == fallback
+        assert [json.loads(body) for body in stdlib] == [json.loads(body) for body in orjson]
+        assert b'"next_cursor":null' in stdlib[4] and b' GMT"' in stdlib[5]
+        # Assert that only orjson writes the non ASCII characters unescaped
+        assert b'"\\u00c5sa fr\\u00e5gar"' in stdlib[5]
+        assert '"Åsa frågar"'.encode() in orjson[5]
+
+    # - - - SQLITE TESTS - - -
+
+    def test_sqlite_production_mode(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users in production mode
+        app.config['SQLITE_PRODUCTION_MODE'] = True
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Assert that new connections are set up with the pragmas
+        with app.app_context():
+            assert db.session.execute('PRAGMA journal_mode').scalar() == 'wal'
+            assert db.session.execute('PRAGMA synchronous').scalar() == 1
+            assert db.session.execute('PRAGMA busy_timeout').scalar() == app.config['SQLITE_BUSY_TIMEOUT_MS']
+            assert db.session.execute('PRAGMA cache_size').scalar() == -app.config['SQLITE_CACHE_SIZE_KB']
+            assert db_manager.get_user_by_username(u1["username"]) is not None
+        # Assert that the connections of file databases are pooled, and only in production mode
+        assert engine_options('sqlite:////tmp/app.db') == {}
+        assert engine_options('sqlite:////tmp/app.db', True)['poolclass'] is QueuePool
+        assert engine_options('sqlite://', True) == {}
+        assert engine_options('postgresql://localhost/app')['pool_size'] == 5
+
+    # - - - REPLICA TESTS - - -
+
+    def test_replica_routing(self):
+        # Use a second database file as replica
+        replica_db = tempfile.mkstemp()
+        app.config['SQLALCHEMY_BINDS'] = {'replica': 'sqlite:///' + replica_db[1]}
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        headers = {"Authorization": acc_token_u1}
+        # Copy the primary to the replica, then user 1 asks a question
+        with app.app_context():
+            replica.sync_sqlite_replica()
+        q1 = {"question_title": "First question","question_body": "First body", "course_room": "TDDD80"}
+        rv_u1_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers=headers)
+        # Assert that the write set the cookie that keeps the client on the primary
+        assert replica.STICKY_COOKIE in rv_u1_asked_q1.headers['Set-Cookie']
+        # Assert that user 1 reads its own write, with the cookie and from another client without it
+        assert len(self.app.get('/myquestions', headers=headers).json["questions"]) == 1
+        other_client = app.test_client()
+        assert len(other_client.get('/myquestions', headers=headers).json["questions"]) == 1
+        # Assert that once the window is over the lists are read from the lagging replica
+        replica.clear_sticky_users()
+        assert len(other_client.get('/myquestions', headers=headers).json["questions"]) == 0
+        assert len(other_client.get('/myquestions?limit=5', headers=headers).json["questions"]) == 0
+        assert other_client.get('/questions/1', headers=headers).status_code == 200
+        with app.app_context():
+            replica.sync_sqlite_replica()
+        assert len(other_client.get('/myquestions', headers=headers).json["questions"]) == 1
+        os.close(replica_db[0])
+        os.unlink(replica_db[1])
+
+    # - - - QUERY BUDGET TESTS - - -
+
+    def test_query_budgets(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login user 1
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # Three other users that each ask, like and answer a question and are followed by user 1
+        for i in range(3):
+            u = {"username": "other{}".format(i),"email": "other{}@test.com".format(i),"password": "namn456"}
+            self.app.post('/users', data=json.dumps(u), content_type='application/json')
+            rv_login_u = self.app.post('/login', data=json.dumps({"email": u["email"], "password": u["password"]}), content_type='application/json')
+            acc_token_u = rv_login_u.json["token_type"] + " " + rv_login_u.json["access_token"]
+            q = {"question_title": "Question {}".format(i),"question_body": "Body", "course_room": "TDDD80"}
+            self.app.post('/questions', data=json.dumps(q), content_type='application/json', headers={"Authorization": acc_token_u})
+            self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u})
+            self.app.post('/answer_question/1', data=json.dumps({"answer_body": "Answer {}".format(i)}), content_type='application/json', headers={"Authorization": acc_token_u})
+            self.app.post('/followed_users/' + u["username"], headers={"Authorization": acc_token_u1})
+        headers = {"Authorization": acc_token_u1}
+        # Assert that the number of queries of each route does not grow with the number of rows
+        self.assert_max_queries(self.app.get('/users', headers=headers), 2)
+        self.assert_max_queries(self.app.get('/users/other1', headers=headers), 2)
+        self.assert_max_queries(self.app.get('/users/current', headers=headers), 0)
+        self.assert_max_queries(self.app.get('/followed_users', headers=headers), 1)
+        self.assert_max_queries(self.app.get('/questions', headers=headers), 2)
+        self.assert_max_queries(self.app.get('/questions?limit=2', headers=headers), 2)
+        self.assert_max_queries(self.app.get('/myquestions', headers=headers), 2)
+        self.assert_max_queries(self.app.get('/questions/1', headers=headers), 2)
+        self.assert_max_queries(self.app.get('/answers/1', headers=headers), 2)
+        self.assert_max_queries(self.app.get('/courses', headers=headers), 0)
+        self.assert_max_queries(self.app.get('/courses/TDDD80/questions', headers=headers), 2)
+        self.assert_max_queries(self.app.get('/courses/TDDD80/questions?limit=2', headers=headers), 2)
+        self.assert_max_queries(self.app.post('/liked_questions/2', headers=headers), 4)
+        self.assert_max_queries(self.app.delete('/liked_questions/2', headers=headers), 4)
+        self.assert_max_queries(self.app.delete('/followed_users/other2', headers=headers), 3)
+        self.assert_max_queries(self.app.post('/followed_users/other2', headers=headers), 3)
+        usernames = {"usernames": ["other0", "other1", "other2", "nobody"]}
+        question_ids = {"question_ids": [1, 2, 3, 4]}
+        self.assert_max_queries(self.app.delete('/followed_users', data=json.dumps(usernames), content_type='application/json', headers=headers), 2)
+        self.assert_max_queries(self.app.post('/followed_users', data=json.dumps(usernames), content_type='application/json', headers=headers), 2)
+        self.assert_max_queries(self.app.post('/liked_questions', data=json.dumps(question_ids), content_type='application/json', headers=headers), 3)
+        self.assert_max_queries(self.app.delete('/liked_questions', data=json.dumps(question_ids), content_type='application/json', headers=headers), 4)
+
+    # - - - CACHING TESTS - - -
+
+    def test_get_question_not_modified(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        u2 = {"username": "nammers2","email": "namn.efernamn@test.com","password": "namn456"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        rv_add_u2 = self.app.post('/users', data=json.dumps(u2), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        rv_login_u2 = self.app.post('/login', data=json.dumps({"email": u2["email"], "password": u2["password"]}), content_type='application/json')
+        acc_token_u2 = rv_login_u2.json["token_type"] + " " + rv_login_u2.json["access_token"]
+        # User 1 asks a question
+        q1 = {"question_title": "First question","question_body": "First body", "course_room": "TDDD80"}
+        rv_u1_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # User 1 fetches the question twice
+        rv_get_q1 = self.app.get('/questions/1', headers={"Authorization": acc_token_u1})
+        etag = rv_get_q1.headers["ETag"]
+        rv_get_q1_again = self.app.get('/questions/1', headers={"Authorization": acc_token_u1, "If-None-Match": etag})
+        # Assert that the second fetch is not modified and that other users get another etag
+        assert rv_get_q1_again.status_code == 304 and rv_get_q1_again.headers["ETag"] == etag
+        rv_u2_get_q1 = self.app.get('/questions/1', headers={"Authorization": acc_token_u2, "If-None-Match": etag})
+        assert rv_u2_get_q1.status_code == 200 and rv_u2_get_q1.headers["ETag"] != etag
+        # User 2 likes the question
+        rv_u2_like_q1 = self.app.post('/liked_questions/1', headers={"Authorization": acc_token_u2})
+        # Assert that the question of user 1 is modified
+        rv_get_q1_liked = self.app.get('/questions/1', headers={"Authorization": acc_token_u1, "If-None-Match": etag})
+        assert rv_get_q1_liked.status_code == 200 and rv_get_q1_liked.json["likes"] == 1
+
+    def test_get_answers_and_courses_not_modified(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # User 1 asks a question
+        q1 = {"question_title": "First question","question_body": "First body", "course_room": "TDDD80"}
+        rv_u1_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        # Fetch the answers and the courses
+        answers_etag = self.app.get('/answers/1', headers={"Authorization": acc_token_u1}).headers["ETag"]
+        courses_etag = self.app.get('/courses', headers={"Authorization": acc_token_u1}).headers["ETag"]
+        # Assert that repeated fetches are not modified
+        assert self.app.get('/answers/1', headers={"Authorization": acc_token_u1, "If-None-Match": answers_etag}).status_code == 304
+        assert self.app.get('/courses', headers={"Authorization": acc_token_u1, "If-None-Match": courses_etag}).status_code == 304
+        # User 1 answers the question and a course is added
+        a1 = {"answer_body": "This is how you do it!"}
+        rv_u1_answer_q1 = self.app.post('/answer_question/1', data=json.dumps(a1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        with app.app_context():
+            db_manager.add_course("TDDD27", "Advanced Web Programming")
+        # Assert that both resources are modified
+        rv_get_answers = self.app.get('/answers/1', headers={"Authorization": acc_token_u1, "If-None-Match": answers_etag})
+        assert rv_get_answers.status_code == 200 and len(rv_get_answers.json["answers"]) == 1
+        rv_get_courses = self.app.get('/courses', headers={"Authorization": acc_token_u1, "If-None-Match": courses_etag})
+        assert rv_get_courses.status_code == 200 and len(rv_get_courses.json["courses"]) == 4
+
+    def test_get_courses_from_catalog_cache(self):
+        # Users
+        u1 = {"username": "nammers1","email": "namn.namnsson@test.com","password": "namn123"}
+        # Register users
+        rv_add_u1 = self.app.post('/users', data=json.dumps(u1), content_type='application/json')
+        # Login Users
+        rv_login_u1 = self.app.post('/login', data=json.dumps({"email": u1["email"], "password": u1["password"]}), content_type='application/json')
+        acc_token_u1 = rv_login_u1.json["token_type"] + " " + rv_login_u1.json["access_token"]
+        # Fetch the courses twice
+        rv_get_courses = self.app.get('/courses', headers={"Authorization": acc_token_u1})
+        rv_get_courses_again = self.app.get('/courses', headers={"Authorization": acc_token_u1})
+        # Assert that the seeded courses are listed and that the second fetch is served from the cache
+        assert [course["course_code"] for course in rv_get_courses.json["courses"]] == ["TDDD80", "TDDC73", "TATA24"]
+        assert rv_get_courses_again.data == rv_get_courses.data
+        self.assert_max_queries(rv_get_courses_again, 0)
+        # Another worker adds a course, which this process only sees as a bumped version stamp
+        app.config['COURSE_CACHE_REFRESH_SECONDS'] = 0
+        with app.app_context():
+            db.session.add(models.Course("TDDD27", "Advanced Web Programming"))
+            db.session.query(models.VersionStamp).filter_by(name='courses').update({"version": models.VersionStamp.version + 1})
+            db.session.commit()
+        # Assert that the new course is picked up and can be asked questions in
+        rv_get_courses_added = self.app.get('/courses', headers={"Authorization": acc_token_u1})
+        assert "TDDD27" in [course["course_code"] for course in rv_get_courses_added.json["courses"]]
+        q1 = {"question_title": "First question","question_body": "First body", "course_room": "TDDD27"}
+        rv_u1_asked_q1 = self.app.post('/questions', data=json.dumps(q1), content_type='application/json', headers={"Authorization": acc_token_u1})
+        assert rv_u1_asked_q1.status_code == 200
+        assert self.app.get('/questions/1', headers={"Authorization": acc_token_u1}).json["course"]["course_code"] == "TDDD27"
+        # This process renames a course
+        app.config['COURSE_CACHE_REFRESH_SECONDS'] = 10
+        with app.app_context():
+            assert db_manager.update_course("TATA24", "Linjär algebra")
+        # Assert that the rename is seen right away
+        rv_get_courses_renamed = self.app.get('/courses', headers={"Authorization": acc_token_u1})
+        courses = {course["course_code"]: course["course_name"] for course in rv_get_courses_renamed.json["courses"]}
+        assert courses["TATA24"] == "Linjär algebra"
+        # This process renames the course of question 1
+        etag = self.app.get('/questions/1', headers={"Authorization": acc_token_u1}).headers["ETag"]
+        with app.app_context():
+            assert db_manager.update_course("TDDD27", "Webbprogrammering")
+        # Assert that the question is modified and has the new course name
+        rv_get_q1_renamed = self.app.get('/questions/1', headers={"Authorization": acc_token_u1, "If-None-Match": etag})
+        assert rv_get_q1_renamed.status_code == 200 and rv_get_q1_renamed.json["course"]["course_name"] == "Webbprogrammering"
+
+    # - - - METRICS TESTS - - -
+
+    def test_metrics_disabled(self):
+        # Fetch the metrics with the default configuration
+        rv_metrics = self.app.get('/metrics')
+        # Assert that they are not exported
+        assert rv_metrics.status_code == 404 and rv_metrics.json["msg"] == "Metrics are disabled"
+
+    def test_metrics(self):
+        # Make a request to the index route
+        app.config['METRICS_ENABLED'] = True
+        rv_index = self.app.get('/')
+        # Fetch the metrics
+        rv_metrics = self.app.get('/metrics')
+        # Assert that the request was counted and timed
+        assert b'http_requests_total{endpoint="/",method="GET",status="200"}' in rv_metrics.data
+        assert b'http_request_duration_seconds_count{endpoint="/",method="GET"}' in rv_metrics.data
+        assert b'db_pool_checkouts_total' in rv_metrics.data
+
+    def test_metrics_pool_overflow(self):
+        # A pool of one connection that three connections are checked out of
+        app.config['METRICS_ENABLED'] = True
+        engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], poolclass=QueuePool, pool_size=1, max_overflow=2)
+        connections = [engine.connect() for i in range(3)]
+        rv_metrics_busy = self.app.get('/metrics')
+        # Return the connections
+        for connection in connections:
+            connection.close()
+        rv_metrics_idle = self.app.get('/metrics')
+        engine.dispose()
+        # Assert that the overflow drops back once the connections are returned
+        assert b'db_pool_overflow 2.0' in rv_metrics_busy.data
+        assert b'db_pool_overflow 0.0' in rv_metrics_idle.data